@@ -0,0 +1,142 @@
+'''
+Acquisition
+
+Runs the sensor polling and filtering apart from the player's control loop,
+so a slow I2C read never holds up the mixer and synth updates.
+
+    "inline"  the control loop polls the keyboard itself, as it always has
+    "thread"  polled on a second thread with _thread, on the second core of
+              an RP2040 under MicroPython, CircuitPython doesn't have _thread
+    "async"   polled by an asyncio task taking turns with the control loop
+              on the one core, needs the asyncio library (and adafruit_ticks)
+              copied into lib/
+
+The acquisition side publishes each new set of levels through a Snapshot,
+a double buffer with a sequence count. The player only ever copies the
+latest snapshot out, neither side takes a lock or waits for the other.
+
+    acquisition=Acquisition.Acquisition(keyboard,"thread")
+    acquisition.start()
+    ...
+    updates=acquisition.read(levels)  # in the control loop
+
+Between readings the acquisition side sleeps until the next sensor is due,
+up to MAX_WAIT_MS, so it doesn't spin on a core or starve the player of
+the interpreter on a host.
+'''
+import array
+import time
+from VL53_Keyboard import ticks_diff
+
+MAX_WAIT_MS=5 # longest the acquisition side sleeps, so stop() is quick
+
+
+class Snapshot():
+    # the levels from one writer to one reader without locks. The writer
+    # fills the back buffer and flips it to the front, the sequence count
+    # is odd while it flips, so a reader which saw the count change under
+    # it copies again
+    def __init__(self,numKeys):
+        self.buffers=(array.array("f",[1.0]*numKeys),array.array("f",[1.0]*numKeys))
+        self.front=0
+        self.seq=0
+        self.updates=0 # the keyboard's updates when the front was published
+        self.retries=0 # reads copied again, for diagnostics
+
+    def back(self):
+        return self.buffers[self.front^1]
+
+    def publish(self,updates):
+        # make the back buffer the front
+        self.seq+=1
+        self.front^=1
+        self.updates=updates
+        self.seq+=1
+
+    def read(self,levels):
+        # copy the front buffer into levels, returns its updates
+        while True:
+            seq=self.seq
+            if not seq&1:
+                front=self.buffers[self.front]
+                updates=self.updates
+                for k in range(len(levels)):
+                    levels[k]=front[k]
+                if self.seq==seq:
+                    return updates
+            self.retries+=1
+
+
+class Acquisition():
+    def __init__(self,keyboard,mode="inline"):
+        self.keyboard=keyboard
+        self.mode=mode
+        self.snapshot=Snapshot(keyboard.getNumKeys())
+        self.running=False
+        self.stopped=True
+        self.error=None # an exception which stopped the acquisition side
+        if mode=="thread":
+            try:
+                import _thread
+            except ImportError:
+                raise RuntimeError("Acquisition: \"thread\" needs _thread, which this port doesn't have, use \"async\" or \"inline\"")
+            self.start_new_thread=_thread.start_new_thread
+        elif mode!="inline" and mode!="async":
+            raise ValueError(f"Unknown acquisition mode {mode}")
+
+    def start(self):
+        # a thread starts now, an async acquisition is run() as a task
+        self.running=True
+        if self.mode=="thread":
+            self.stopped=False
+            self.start_new_thread(self.loop,())
+
+    def stop(self):
+        # ask the acquisition side to finish, and wait for a thread to
+        self.running=False
+        while self.mode=="thread" and not self.stopped:
+            time.sleep(0.001)
+
+    def acquire(self):
+        # poll the keyboard, publishing any new levels
+        # returns ms until the next sensor is due
+        keyboard=self.keyboard
+        snapshot=self.snapshot
+        keyboard.getAllLevels(snapshot.back())
+        if keyboard.updates!=snapshot.updates:
+            snapshot.publish(keyboard.updates)
+        wait=ticks_diff(keyboard.due[keyboard.order[0]],keyboard.ticks())
+        return wait if wait<MAX_WAIT_MS else MAX_WAIT_MS
+
+    def loop(self):
+        # the thread
+        try:
+            while self.running:
+                wait=self.acquire()
+                if wait>0:
+                    time.sleep(wait/1000)
+        except Exception as e:
+            self.error=e
+        self.stopped=True
+
+    async def run(self):
+        # the asyncio task
+        import asyncio
+        self.stopped=False
+        try:
+            while self.running:
+                wait=self.acquire()
+                await asyncio.sleep(wait/1000 if wait>0 else 0)
+        except Exception as e:
+            self.error=e
+        self.stopped=True
+
+    def read(self,levels):
+        # the latest levels into levels, returns the keyboard's count of
+        # readings they include
+        if self.mode=="inline":
+            self.keyboard.getAllLevels(levels)
+            return self.keyboard.updates
+        if self.error:
+            raise self.error
+        return self.snapshot.read(levels)
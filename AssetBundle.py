@@ -0,0 +1,62 @@
+'''
+AssetBundle
+
+Loads the sample bundles written by tools/PackAssets.py.
+
+The index is read when the bundle is opened, then each sample is one seek and
+readinto() straight into its buffer. loadAll() reads the whole bundle in one
+pass from start to end.
+
+    bundle=AssetBundle.Bundle("Music/MixPlayer.pak")
+    samples=bundle.loadAll()   # name -> RawSample
+    mixer.voice[0].play(samples["Music/tom-tom.wav"])
+
+'''
+import array
+import struct
+
+import audiocore
+
+MAGIC=b"PAK1"
+
+
+class Bundle():
+    def __init__(self,path):
+        self.path=path
+        self.index={} # name -> (sample rate,channels,bits,offset,length)
+        self.names=[] # in file order
+        with open(path,"rb") as f:
+            if f.read(4)!=MAGIC:
+                raise ValueError(f"{path} is not an asset bundle")
+            count=struct.unpack("<H",f.read(2))[0]
+            for i in range(count):
+                size=f.read(1)[0]
+                name=f.read(size).decode()
+                self.index[name]=struct.unpack("<IBBII",f.read(14))
+                self.names.append(name)
+
+    def __contains__(self,name):
+        return name in self.index
+
+    def _read(self,f,name):
+        rate,channels,bits,offset,length=self.index[name]
+        if bits==8:
+            data=array.array("B",bytes(length))
+        else:
+            data=array.array("h",bytes(length))
+        f.seek(offset)
+        f.readinto(data)
+        return audiocore.RawSample(data,channel_count=channels,sample_rate=rate)
+
+    def load(self,name):
+        # one sample as a RawSample
+        with open(self.path,"rb") as f:
+            return self._read(f,name)
+
+    def loadAll(self):
+        # every sample, in file order so it is one sequential read
+        samples={}
+        with open(self.path,"rb") as f:
+            for name in self.names:
+                samples[name]=self._read(f,name)
+        return samples
@@ -0,0 +1,812 @@
+'''
+Engine
+
+The control loop shared by the players. A player is a CONFIG dict naming
+the sound source played by the keys and any backing loops, the Engine builds
+the keyboard, mixer and source from it and runs the loop.
+
+    import Engine
+    CONFIG={"source":"harmonics","harmonics":[1,2],"backing":["Music/loop2.wav"]}
+    engine=Engine.Engine(CONFIG)
+    if Engine.AUTORUN:
+        engine.run()
+
+so importing a player, e.g. import Player in code.py, plays it. The hostsim
+benchmarks clear AUTORUN to import the players and drive engine.step().
+
+Sources
+    tones      a sine wavetable note per key, louder as the hand gets closer
+    harmonics  as tones with the "harmonics" mixed in
+    loops      a WAV loop per key, louder as the hand gets closer, with a
+               "tempo" each loop starts on the next bar (or beat) when a
+               hand comes near and stops on one once it has gone
+    synth      synthio notes or chords per key, pressed below "press_level"
+    hits       a single hit per key played once each time the key is struck,
+               louder the faster the hand comes down, see OneShots
+
+"source" can also be a list, the keys are split between the sources in
+order e.g. ["loops","hits"] has a loop per key of "loops" then a hit per
+key of "hits". tones, harmonics and synth play all the keys left.
+
+Only the modules a source needs are imported, when it is built. See
+DEFAULTS for everything a CONFIG can set.
+
+"gestures" maps the gestures of Gestures.py to what they do
+    swipe      "octave" up or down one of "octaves"
+               "bend" the synth's notes "bend" semitones up or down, a swipe
+               the other way goes back
+    tremolo    "vibrato" on the synth notes of the key while it is shaken
+or to a function called with the engine and the event's arguments, e.g.
+{"hold":lambda engine,k:print("held",k)}.
+
+Boot is staged so the audio, and any backing loop, starts as soon as
+possible. The keyboard is set up without its sensors and the source only
+makes the notes of its starting octave. The sensors are then started one at
+a time, and the other octaves built a note at a time, between passes of the
+control loop. The time of each stage is printed.
+
+The sensors can be polled on a second thread, or in an asyncio task, with
+"acquisition", the control loop then takes a snapshot of the levels each
+pass, see Acquisition. CircuitPython has no threads, there only "async"
+works and it shares the one core.
+
+Waveshare pico-audio
+GP 26
+GP 27
+GP 28
+
+I2C - connection to "keyboard" via TCA9548 I2C MUX
+GP 2 SDA
+GP 3 SCL
+GP 4 RST resets the MUX
+'''
+import time
+BOOT=time.monotonic() # the player starts by importing Engine, for the boot profile
+AUTORUN=True # players run their engine when imported
+
+import array
+import gc
+import sys
+import board
+import VL53_Keyboard
+
+DEFAULTS={
+    "source":"tones",
+    "sample_rate":8000,
+    "backing":[],          # loops played throughout on their own voices
+    "backing_vol":0.1,
+    "max_dist":0.1,        # keys sound below this level, the keyboard's 0..1
+    "scale":1.0,           # the volume of a touched key is max_dist*scale
+    "smoothing":0.25,      # fraction of the way to a new key level per tick
+    "tick_ms":4,           # ms between mixer level updates
+    # tones and harmonics
+    "polyphony":4,         # keys which can sound at once, sharing the voices
+    "octaves":[2,3,4],     # built in the background for transpose(), within Wavetables.TABLE_BUDGET
+    "octave":3,            # A3..G4 on the first 8 keys, the synth plays its notes as written here
+    "harmonics":[1,2],     # harmonics added to the base e.g. [1,2,3,4] or [1,3,5]
+    "harmonic_weights":None, # amplitude of each harmonic e.g. [0.5,0.3], None for 1/(h+1)
+    # loops
+    "loops":[],            # WAV file per key
+    # hits, see OneShots
+    "hits":[],             # WAV file per key, held in RAM
+    "bundle":None,         # AssetBundle to load the hits from, if it has them
+    "hit_voices":4,        # mixer voices the hits take turns on
+    "choke":None,          # choke group per key, a hit stops the others in its group
+    "hit_level":0.1,       # a key strikes when its level drops below this
+    "hit_release":0.15,    # and strikes again once it has gone back above this
+    "full_speed":3.0,      # levels per second approach for a full velocity hit
+    "hit_vol":0.2,
+    # synth
+    "notes":[],            # midi note or list of notes (a chord) per key
+    "press_level":0.1,     # a key is pressed when its level is below this
+    "response":"exp",      # "linear", "exp" (more control when quiet) or "log"
+    "synth_vol":0.2,
+    # transport, see Transport
+    "tempo":None,          # beats per minute, None for no transport
+    "beats_per_bar":4,
+    "quantum":"bar",       # loops start and stop on the next "beat" or "bar"
+    # gestures, see Gestures
+    "gestures":None,       # gesture -> action e.g. {"swipe":"octave"}, see gesture()
+    "gesture_level":0.1,   # keys below this level are near for gestures
+    "hold_ms":1000,
+    "bend":2,              # semitones a swipe bends the synth
+    "vibrato_depth":0.3,   # semitones either way
+    "vibrato_rate":5.0,    # Hz
+    "acquisition":"inline", # "inline", "thread" (needs _thread) or "async" (needs lib/asyncio), see Acquisition
+    "debug":False,         # print the key levels when they change
+    "metrics":False,       # print run time statistics every few seconds, see Metrics
+}
+
+CURVE_SIZE=33 # points in the synth response lookup table
+
+
+def midiNoteFreq(note):
+    # calculate freq of a midi note number
+    # matches https://newt.phys.unsw.edu.au/jw/notes.html
+    # midi keyboard starts at A0 (Note=21)
+    # 1 octave = 12 steps/notes
+    # frequency of A4 (common value is 440Hz)
+    a = 440
+    return (a / 32) * (2 ** ((note - 9) / 12))
+
+
+def makeChord(midiRoot,octave,major=True):
+    # midi notes of a triad, octave 4 is where we find middle C
+    # but it is 60/12=5 so the octave is bumped by 1
+    oct=octave+1
+    A=midiRoot+12*oct
+    B=A+(4 if major else 3)
+    C=A+7
+    return [A,B,C]
+
+
+class ToneSource():
+    # a wavetable note per key sharing a few voices, see VoicePool
+    def __init__(self,engine,waveform="sine",keys=None):
+        c=self.config=engine.config
+        self.numKeys=engine.numKeys if keys is None else keys
+        self.sample_rate=c["sample_rate"]
+        self.max_dist=c["max_dist"]
+        self.scale=c["scale"]
+        self.voices=c["polyphony"]
+        self.waveform=waveform
+        self.pool=None
+
+    def start(self,mixer,first=0):
+        # only the notes of the starting octave are made now, the other
+        # octaves are built a note at a time by idle()
+        import audiocore
+        import Wavetables
+        import LevelSmoother
+        import VoicePool
+        c=self.config
+        self.RawSample=audiocore.RawSample
+        self.bank=Wavetables.bank
+        if self.waveform=="harmonics":
+            if c["harmonics"]:
+                self.bank.addWaveform("harmonics",Wavetables.harmonicPartials(c["harmonics"],c["harmonic_weights"]))
+            else:
+                self.waveform="sine"
+
+        # first octave minus 4 black keys i.e. Ax Bx Cx Dx Ex Fx Gx Ax+1
+        # carrying on up the white keys when there are more than 8 keys
+        # the notes for each octave are cached so switching octave is instant
+        self.octaveNotes=[None]*self.numKeys
+        self.octaves=Wavetables.Octaves(self.makeTone,Wavetables.naturalNotes(self.numKeys))
+        self.setMidiOctave(c["octave"])
+        self.octaves.background(c["octaves"]) # tables ready for live transpose
+
+        # the mixer levels glide to the key levels at a steady tick_ms
+        self.smoother=LevelSmoother.LevelSmoother(self.numKeys,c["tick_ms"],c["smoothing"])
+
+        # keys only get a mixer voice while they are sounding
+        self.pool=VoicePool.VoicePool(mixer,self.numKeys,self.voices,first,
+                                      full_scale=self.max_dist*self.scale)
+        self.pool.setSamples(self.octaveNotes)
+
+    def idle(self):
+        # a little background work, False when there is none left
+        return self.octaves.buildNext()
+
+    def makeTone(self,midiNote,vol=1.0):
+        # a looped note from the shared wavetable bank
+        # the table holds enough cycles to be in tune and is cached
+        freq=midiNoteFreq(midiNote)
+        print("makeTone",self.waveform,midiNote,freq)
+        table=self.bank.table(freq,self.waveform,self.sample_rate,vol)
+        return self.RawSample(table,sample_rate=self.sample_rate)
+
+    def setMidiOctave(self,octave):
+        # octave 0 starts at midiNote 21 (A0)
+        # octave 4 starts at midiNote 69 (= 21+4*12)
+        print("Setting up Octave ",octave)
+        self.octaveNotes[:]=self.octaves.get(octave)
+
+    def transpose(self,octave):
+        # change octave while playing
+        # each sounding voice is switched to its new note keeping its level
+        # so held keys carry on sounding, there is no rebuild or gap
+        self.setMidiOctave(octave)
+        self.pool.setSamples(self.octaveNotes)
+
+    def play(self,levels):
+        # locals, this runs every pass of the control loop
+        smoother=self.smoother
+        max_dist=self.max_dist
+        scale=self.scale
+        for k in range(self.numKeys):
+            level=levels[k]
+            smoother.setTarget(k,scale*(max_dist-level) if level<max_dist else 0.0)
+        if smoother.tick():
+            pool=self.pool
+            for k in range(self.numKeys):
+                pool.setLevel(k,smoother.level(k))
+            pool.update()
+
+    def level(self,k):
+        return self.pool.level(k)
+
+    def silence(self):
+        self.pool.silence()
+
+
+class LoopSource():
+    # a WAV loop per key, all playing from the start at level 0
+    # or with a transport started and stopped in time by the keys
+    def __init__(self,engine,keys=None):
+        import LevelSmoother
+        c=engine.config
+        self.engine=engine
+        self.quantum=c["quantum"]
+        self.max_dist=c["max_dist"]
+        self.scale=c["scale"]
+        self.paths=c["loops"][:engine.numKeys if keys is None else keys]
+        self.voices=self.numKeys=len(self.paths)
+        self.smoother=LevelSmoother.LevelSmoother(self.voices,c["tick_ms"],c["smoothing"])
+        self.active=bytearray(self.voices) # started, or about to start
+        self.loops=None
+        self.mixer=None
+        self.transport=None
+
+    def start(self,mixer,first=0):
+        # the files are opened now the audio is playing
+        # streamed from flash, see StreamLoops.MEMORY_LIMIT
+        import StreamLoops
+        self.loops=StreamLoops.Loops(self.paths)
+        self.mixer=mixer
+        self.first=first
+        self.transport=self.engine.transport
+        if self.transport is None:
+            self.loops.play(mixer,first,0.0) # silent for now
+
+    def idle(self):
+        return False
+
+    def transpose(self,octave):
+        pass # loops have no pitch to change
+
+    def play(self,levels):
+        smoother=self.smoother
+        max_dist=self.max_dist
+        scale=self.scale
+        for k in range(self.voices):
+            level=levels[k]
+            smoother.setTarget(k,scale*(max_dist-level) if level<max_dist else 0.0)
+        transport=self.transport
+        if transport:
+            active=self.active
+            for k in range(self.voices):
+                near=levels[k]<max_dist
+                if near and not active[k]:
+                    transport.trigger(self.first+k,self.loops[k],self.quantum)
+                    active[k]=1
+                elif active[k] and not near:
+                    transport.trigger(self.first+k,None,self.quantum)
+                    active[k]=0
+        if smoother.tick():
+            voice=self.mixer.voice
+            for k in range(self.voices):
+                voice[self.first+k].level=smoother.level(k)
+
+    def level(self,k):
+        if k>=self.voices or not self.mixer.voice[self.first+k].playing:
+            return 0.0
+        return self.mixer.voice[self.first+k].level
+
+    def silence(self):
+        for k in range(self.voices):
+            self.mixer.stop_voice(self.first+k)
+
+
+class SynthSource():
+    # synthio notes per key, a key presses its notes when its level drops
+    # below press_level and the amplitude follows the key from there
+    def __init__(self,engine,keys=None):
+        c=self.config=engine.config
+        self.numKeys=engine.numKeys if keys is None else keys
+        self.press_level=c["press_level"]
+        self.synth_vol=c["synth_vol"]
+        self.debug=c["debug"]
+        self.voices=1 # synthio all goes through one mixer voice
+
+    def start(self,mixer,first=0):
+        import synthio
+        import ulab.numpy as np
+        c=self.config
+        self.midi_to_hz=synthio.midi_to_hz
+        self.Note=synthio.Note
+        self.LFO=synthio.LFO
+
+        print("Setting up the synth")
+        wave_sine=np.array(np.sin(np.linspace(0,2*np.pi,512,endpoint=False))*32000,dtype=np.int16)
+        self.synth=synthio.Synthesizer(sample_rate=c["sample_rate"],waveform=wave_sine)
+        self.synth.envelope=synthio.Envelope(attack_time=0.1,sustain_level=0.5,release_time=0.2)
+        self.synth.release_all() # keys only press/release notes when they change
+
+        # the notes for each key as a list, whether a single note or a chord
+        # with more keys than notes they repeat an octave higher each time
+        notes=c["notes"]
+        self.keyNotes=[]
+        for k in range(self.numKeys):
+            chord=notes[k%len(notes)]
+            if type(chord) is int:
+                chord=[chord]
+            up=12*(k//len(notes))
+            self.keyNotes.append([n+up for n in chord if n+up<128])
+
+        self.curve=self.makeCurve(c["response"])
+
+        # one synthio.Note per midi note, made when first needed and reused
+        # so the amplitude of a sounding note can be changed in place
+        self.synthNotes=[None]*128
+        for k in range(self.numKeys):
+            for n in self.keyNotes[k]:
+                self.getNote(n)
+
+        # semitones added to every key's notes, see transpose()
+        self.transposition=0
+
+        # key state from the last pass, and the transposition each key
+        # was pressed with so its release matches the notes it pressed
+        self.keyDown=bytearray(self.numKeys)
+        self.keyShift=array.array("b",[0]*self.numKeys)
+
+        # how many held keys are sounding each midi note
+        # chord notes shared between keys are only released with the last key
+        self.noteCount=bytearray(128)
+
+        # scratch amplitude per midi note for setExpression()
+        self.noteAmp=array.array("f",[0.0]*128)
+        self.levels=None
+
+        # pitch bend in octaves, and the keys with vibrato sharing one LFO
+        self.bent=0.0
+        self.vibrating=bytearray(self.numKeys)
+        self.lfo=None
+
+        mixer.voice[first].play(self.synth)
+        mixer.voice[first].level=self.synth_vol
+
+    def idle(self):
+        return False
+
+    @staticmethod
+    def makeCurve(response,size=CURVE_SIZE):
+        # lookup table mapping 0..1 (how far the key is pressed) to amplitude
+        curve=array.array("f",[0.0]*size)
+        for i in range(size):
+            x=i/(size-1)
+            if response=="exp":
+                x=x*x
+            elif response=="log":
+                x=x**0.5
+            curve[i]=x
+        return curve
+
+    def expression(self,level):
+        # amplitude for a key level, 0 at press_level up to 1 touching
+        x=1-level/self.press_level
+        if x<=0:
+            return 0.0
+        curve=self.curve
+        pos=min(x,1.0)*(CURVE_SIZE-1)
+        i=int(pos)
+        if i>=CURVE_SIZE-1:
+            return curve[CURVE_SIZE-1]
+        return curve[i]+(curve[i+1]-curve[i])*(pos-i)
+
+    def getNote(self,n):
+        note=self.synthNotes[n]
+        if note is None:
+            note=self.synthNotes[n]=self.Note(self.midi_to_hz(n),amplitude=0.0)
+        return note
+
+    def pressKey(self,k):
+        self.keyDown[k]=1
+        self.keyShift[k]=self.transposition
+        for n in self.keyNotes[k]:
+            n+=self.transposition
+            if not 0<=n<128:
+                continue # transposed off the midi range
+            self.noteCount[n]+=1
+            if self.noteCount[n]==1:
+                note=self.getNote(n)
+                note.amplitude=self.expression(self.levels[k])
+                note.bend=self.lfo if self.vibrating[k] else self.bent
+                self.synth.press(note)
+                if self.debug:
+                    print("Pressing note",n)
+
+    def releaseKey(self,k):
+        self.keyDown[k]=0
+        for n in self.keyNotes[k]:
+            n+=self.keyShift[k]
+            if not 0<=n<128:
+                continue
+            self.noteCount[n]-=1
+            if self.noteCount[n]==0:
+                self.synth.release(self.synthNotes[n])
+                if self.debug:
+                    print("Releasing note",n)
+
+    def setExpression(self):
+        # set the amplitude of every sounding note from its keys
+        # a note shared by several held keys follows the closest
+        # worked out in noteAmp first so a note is only set once
+        keyDown=self.keyDown
+        keyShift=self.keyShift
+        noteAmp=self.noteAmp
+        for k in range(self.numKeys):
+            if keyDown[k]:
+                for n in self.keyNotes[k]:
+                    n+=keyShift[k]
+                    if 0<=n<128:
+                        noteAmp[n]=0.0
+        for k in range(self.numKeys):
+            if keyDown[k]:
+                amp=self.expression(self.levels[k])
+                for n in self.keyNotes[k]:
+                    n+=keyShift[k]
+                    if 0<=n<128 and amp>noteAmp[n]:
+                        noteAmp[n]=amp
+        for k in range(self.numKeys):
+            if keyDown[k]:
+                for n in self.keyNotes[k]:
+                    n+=keyShift[k]
+                    if 0<=n<128:
+                        self.synthNotes[n].amplitude=noteAmp[n]
+
+    def transpose(self,octave):
+        # change register while playing, the notes are as written in the
+        # CONFIG "octave" and move up (or down) from there
+        # held keys are moved to the new notes straight away
+        self.transposition=12*(octave-self.config["octave"])
+        for k in range(self.numKeys):
+            if self.keyDown[k]:
+                self.releaseKey(k)
+                self.pressKey(k)
+
+    def bend(self,semitones):
+        # bend every note, sounding or not
+        self.bent=semitones/12
+        if self.lfo:
+            self.lfo.offset=self.bent
+        for k in range(self.numKeys):
+            for n in self.keyNotes[k]:
+                n+=self.keyShift[k]
+                note=self.synthNotes[n] if 0<=n<128 else None
+                if note and not self.vibrating[k]:
+                    note.bend=self.bent
+
+    def vibrato(self,k,on):
+        # wobble the pitch of key k's notes around the bend
+        if self.lfo is None:
+            c=self.config
+            self.lfo=self.LFO(rate=c["vibrato_rate"],scale=c["vibrato_depth"]/12,offset=self.bent)
+        self.vibrating[k]=on
+        for n in self.keyNotes[k]:
+            n+=self.keyShift[k]
+            if 0<=n<128:
+                self.getNote(n).bend=self.lfo if on else self.bent
+
+    def play(self,levels):
+        # press or release only the keys that changed since last time
+        # so held notes are not retriggered, then follow the key
+        # distances with the note amplitudes
+        self.levels=levels
+        keyDown=self.keyDown
+        press_level=self.press_level
+        for k in range(self.numKeys):
+            down=levels[k]<press_level
+            if down and not keyDown[k]:
+                self.pressKey(k)
+            elif keyDown[k] and not down:
+                self.releaseKey(k)
+        self.setExpression()
+
+    def level(self,k):
+        # the quietest of the key's notes, 0 if not pressed
+        if not self.keyDown[k]:
+            return 0.0
+        amp=1.0
+        for n in self.keyNotes[k]:
+            n+=self.keyShift[k]
+            if 0<=n<128:
+                amp=min(amp,self.synthNotes[n].amplitude)
+        return amp
+
+    def silence(self):
+        self.synth.release_all()
+
+
+class HitSource():
+    # a one shot hit per key, fired as the key is struck, see OneShots
+    def __init__(self,engine,keys=None):
+        import OneShots
+        c=engine.config
+        self.ticks=engine.keyboard.ticks
+        self.paths=c["hits"][:engine.numKeys if keys is None else keys]
+        self.bundle=c["bundle"]
+        self.samples=None
+        self.numKeys=len(self.paths)
+        self.voices=c["hit_voices"]
+        self.hit_vol=c["hit_vol"]
+        self.choke=c["choke"]
+        self.onsets=OneShots.Onsets(self.numKeys,c["hit_level"],c["hit_release"],c["full_speed"])
+        self.SampleCache=OneShots.SampleCache
+        self.HitVoices=OneShots.HitVoices
+        self.hits=None
+
+    def start(self,mixer,first=0):
+        # loaded now the audio is playing, in RAM so a hit starts straight away
+        self.samples=self.SampleCache(self.paths,self.bundle)
+        self.hits=self.HitVoices(mixer,first,self.voices,self.choke)
+
+    def idle(self):
+        return False
+
+    def transpose(self,octave):
+        pass
+
+    def play(self,levels):
+        onsets=self.onsets
+        now=self.ticks()
+        for k in range(self.numKeys):
+            velocity=onsets.update(k,levels[k],now)
+            if velocity:
+                self.hits.hit(k,self.samples[k],velocity*self.hit_vol)
+
+    def level(self,k):
+        return self.hits.level(k)
+
+    def silence(self):
+        self.hits.silence()
+
+
+class SplitSource():
+    # sources side by side, each playing the keys after the last one's
+    # they each see their own keys numbered from 0
+    def __init__(self,engine,names):
+        self.sources=[]
+        self.firstKey=[]
+        first=0
+        for name in names:
+            source=SOURCES[name](engine,engine.numKeys-first)
+            self.sources.append(source)
+            self.firstKey.append(first)
+            first+=source.numKeys
+        self.numKeys=first
+        self.voices=sum(source.voices for source in self.sources)
+        self.views=None
+
+    def start(self,mixer,first=0):
+        for source in self.sources:
+            source.start(mixer,first)
+            first+=source.voices
+
+    def idle(self):
+        busy=False
+        for source in self.sources:
+            if source.idle():
+                busy=True
+        return busy
+
+    def transpose(self,octave):
+        for source in self.sources:
+            source.transpose(octave)
+
+    def play(self,levels):
+        if self.views is None:
+            # made once, slicing every pass would allocate
+            view=memoryview(levels)
+            self.views=[view[first:first+source.numKeys] for first,source in zip(self.firstKey,self.sources)]
+        for i in range(len(self.sources)):
+            self.sources[i].play(self.views[i])
+
+    def level(self,k):
+        for first,source in zip(self.firstKey,self.sources):
+            if k<first+source.numKeys:
+                return source.level(k-first)
+        return 0.0
+
+    def silence(self):
+        for source in self.sources:
+            source.silence()
+
+
+SOURCES={
+    "tones":lambda engine,keys=None:ToneSource(engine,"sine",keys),
+    "harmonics":lambda engine,keys=None:ToneSource(engine,"harmonics",keys),
+    "loops":LoopSource,
+    "synth":SynthSource,
+    "hits":HitSource,
+}
+
+
+class Engine():
+    def __init__(self,config):
+        # config overrides DEFAULTS
+        # the audio starts first, the sources only read their config until
+        # start(), the sensors are started and the other octaves built a
+        # little at a time by step(), see boot()
+        self.config=dict(DEFAULTS)
+        self.config.update(config)
+        c=self.config
+        self.debug=c["debug"]
+        self.last_stage=BOOT
+        self.stage("imports")
+
+        # access to the keyboard (SDA,SCL and RST)
+        self.keyboard=VL53_Keyboard.Keyboard(board.GP2,board.GP3,board.GP4,staged=True)
+        self.numKeys=self.keyboard.getNumKeys()
+
+        # the sensors are polled by the control loop, or alongside it
+        import Acquisition
+        self.acquisition=Acquisition.Acquisition(self.keyboard,c["acquisition"])
+
+        self.metrics=None
+        if c["metrics"]:
+            import Metrics
+            self.metrics=Metrics.Metrics(self.keyboard)
+
+        if type(c["source"]) is list:
+            self.source=SplitSource(self,c["source"])
+        else:
+            self.source=SOURCES[c["source"]](self)
+        self.stage("keyboard")
+
+        # audio output
+        import audiobusio
+        import audiomixer
+        try:
+            # using the waveshare pico-Audio I2S pins
+            self.audio=audiobusio.I2SOut(board.GP27,board.GP28,board.GP26)
+        except Exception as e:
+            sys.exit(f"EXCEPTION: Unable to setup I2S, {e}")
+
+        # the source's voices first then the backing loops
+        backing=c["backing"]
+        self.mixer=audiomixer.Mixer(voice_count=self.source.voices+len(backing),sample_rate=c["sample_rate"],
+                                    channel_count=1,bits_per_sample=16,samples_signed=True)
+        self.audio.play(self.mixer) # must start the mixer before adding voices
+
+        self.transport=None
+        if c["tempo"]:
+            import Transport
+            self.transport=Transport.Transport(self.mixer,c["tempo"],c["beats_per_bar"])
+
+        self.backing=None
+        if backing:
+            # streamed from flash, see StreamLoops.MEMORY_LIMIT
+            import StreamLoops
+            self.backing=StreamLoops.Loops(backing)
+            self.backing.play(self.mixer,self.source.voices,c["backing_vol"])
+        if self.transport:
+            # beat 0 is when the backing loops start
+            self.transport.start()
+        self.stage("audio")
+
+        self.source.start(self.mixer)
+        self.stage("source")
+
+        # filled in place by the keyboard so the control loop doesn't allocate
+        self.levels=array.array("f",[0.0]*self.numKeys)
+        self.last_update=0
+        self.count=0
+
+        # the octave swipes move from
+        self.octave=c["octave"]
+        self.bent=0 # -1, 0 or 1 "bend"s
+
+        self.gestures=None
+        if c["gestures"]:
+            import Gestures
+            for gesture,action in c["gestures"].items():
+                if action in ("bend","vibrato") and not hasattr(self.source,action):
+                    raise ValueError(f"{gesture} can't {action} the {c['source']} source")
+            self.gestures=Gestures.Gestures(self.numKeys,self,c["gesture_level"],c["hold_ms"])
+            self.last_gesture=0
+
+        # background start up still to do
+        self.warming=True                      # source.idle() has work
+        self.starting=not self.keyboard.ready() # sensors to start
+        self.booting=True
+        self.acquisition.start()
+        print("mem_free",gc.mem_free())
+
+    def stage(self,name):
+        # boot profile, time of the stage and since the player started
+        now=time.monotonic()
+        print(f"Boot {name:9} {1000*(now-self.last_stage):6.0f} ms  at {1000*(now-BOOT):6.0f} ms")
+        self.last_stage=now
+
+    def boot(self):
+        # the background part of start up, a little each pass
+        if self.warming:
+            self.warming=self.source.idle()
+            if not self.warming:
+                self.stage("tables")
+        if self.starting and self.keyboard.ready():
+            self.starting=False
+            self.stage("sensors")
+        self.booting=self.warming or self.starting
+
+    def step(self):
+        # one pass of the control loop
+        # the keyboard normalises the key value to the range 0..1.0
+        updates=self.acquisition.read(self.levels)
+        if self.debug and updates!=self.last_update:
+            self.last_update=updates
+            print(self.count,list(self.levels))
+            self.count+=1
+        if self.gestures and updates!=self.last_gesture:
+            # only when there are new readings
+            self.last_gesture=updates
+            self.gestures.update(self.levels,self.keyboard.ticks())
+        self.source.play(self.levels)
+        if self.transport:
+            self.transport.poll()
+        if self.booting:
+            self.boot()
+
+    def transpose(self,octave):
+        # to octave, the same for every source, the CONFIG "octave" is
+        # where they start
+        self.source.transpose(octave)
+        self.octave=octave
+
+    def gesture(self,gesture,*args):
+        # carry out the action CONFIG gives the gesture
+        action=self.config["gestures"].get(gesture)
+        if self.debug:
+            print("Gesture",gesture,*args)
+        if action=="octave":
+            octave=self.octave+args[0]
+            if octave in self.config["octaves"]:
+                self.transpose(octave)
+        elif action=="bend":
+            self.bent=max(-1,min(1,self.bent+args[0]))
+            self.source.bend(self.bent*self.config["bend"])
+        elif action=="vibrato":
+            self.source.vibrato(*args)
+        elif callable(action):
+            action(self,*args)
+
+    # the Gestures listener
+    def swipe(self,direction):
+        self.gesture("swipe",direction)
+
+    def hold(self,k):
+        self.gesture("hold",k)
+
+    def tremolo(self,k,on):
+        self.gesture("tremolo",k,on)
+
+    def run(self):
+        # play until something goes wrong
+        # sensor faults are handled by the keyboard, one key at a time
+        try:
+            if self.acquisition.mode=="async":
+                import asyncio
+                asyncio.run(self.play())
+            else:
+                while True:
+                    self.step()
+                    if self.metrics:
+                        self.metrics.loop()
+        except Exception as e:
+            print("Player Exception",e)
+            import traceback
+            traceback.print_exception(e)
+            self.source.silence()
+        self.acquisition.stop()
+
+    async def play(self):
+        # the control loop taking turns with the acquisition task
+        import asyncio
+        asyncio.create_task(self.acquisition.run())
+        while True:
+            self.step()
+            if self.metrics:
+                self.metrics.loop()
+            await asyncio.sleep(0)
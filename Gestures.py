@@ -0,0 +1,138 @@
+'''
+Gestures
+
+Hand movements over the keys, recognised from the key levels the control
+loop already has, so there are no extra sensor reads.
+
+    swipe    a hand passing over SWIPE_KEYS or more adjacent keys in turn,
+             direction +1 up the keys, -1 down
+    hold     a key kept near for hold_ms, still
+    tremolo  a hand shaking up and down over a key, at least
+             TREMOLO_REVERSALS changes of direction each more than
+             tremolo_depth within tremolo_ms of the last
+
+A key is near when its level is below near_level. Each gesture is a small
+state machine updated a reading at a time, the state is a few numbers per
+key and there is no history kept. The events are passed to a listener
+
+    gestures=Gestures.Gestures(numKeys,listener)
+    ...
+    gestures.update(levels,ticks_ms())
+
+which has swipe(direction), hold(k) and tremolo(k,on) methods, tremolo is
+called with on False once the shaking stops.
+'''
+import array
+from VL53_Keyboard import ticks_diff
+
+NEAR_LEVEL=0.1
+SWIPE_KEYS=3          # adjacent keys in a row for a swipe
+SWIPE_GAP_MS=250      # longest from one key of a swipe to the next
+SWIPE_MIN_MS=10       # and shortest, a flat hand comes down on keys together
+HOLD_MS=1000
+TREMOLO_DEPTH=0.01    # level change which counts as a change of direction
+TREMOLO_MS=300        # longest between changes of direction
+TREMOLO_REVERSALS=4
+NO_KEY=-1
+
+
+class Gestures():
+    def __init__(self,numKeys,listener,near_level=NEAR_LEVEL,hold_ms=HOLD_MS,
+                 tremolo_depth=TREMOLO_DEPTH,tremolo_ms=TREMOLO_MS):
+        self.numKeys=numKeys
+        self.listener=listener
+        self.near_level=near_level
+        self.hold_ms=hold_ms
+        self.tremolo_depth=tremolo_depth
+        self.tremolo_ms=tremolo_ms
+
+        # per key
+        self.near=bytearray(numKeys)
+        self.nearAt=array.array("l",[0]*numKeys)     # ticks ms it came near
+        self.held=bytearray(numKeys)
+        self.last=array.array("f",[1.0]*numKeys)     # level last time
+        self.rising=bytearray(numKeys)                # the level's direction
+        self.extreme=array.array("f",[1.0]*numKeys)  # furthest level this direction
+        self.reversals=bytearray(numKeys)
+        self.reversedAt=array.array("l",[0]*numKeys)
+        self.trembling=bytearray(numKeys)
+
+        # the swipe so far
+        self.swipeKey=NO_KEY   # the last key it reached
+        self.swipeAt=0
+        self.swipeDir=0
+        self.swipeRun=0
+
+    def update(self,levels,now):
+        # call with each new set of levels
+        near_level=self.near_level
+        for k in range(self.numKeys):
+            level=levels[k]
+            if level<near_level:
+                if not self.near[k]:
+                    self.near[k]=1
+                    self.nearAt[k]=now
+                    self.rising[k]=0
+                    self.extreme[k]=level
+                    self.swipe(k,now)
+                elif not self.held[k] and not self.trembling[k] and ticks_diff(now,self.nearAt[k])>=self.hold_ms:
+                    self.held[k]=1
+                    self.listener.hold(k)
+                if level!=self.last[k]:
+                    self.shake(k,level,now)
+            elif self.near[k]:
+                self.near[k]=0
+                self.held[k]=0
+                self.reversals[k]=0
+            if self.trembling[k] and (not self.near[k] or ticks_diff(now,self.reversedAt[k])>self.tremolo_ms):
+                self.trembling[k]=0
+                self.reversals[k]=0
+                self.listener.tremolo(k,False)
+            self.last[k]=level
+
+    def swipe(self,k,now):
+        # key k has just come near
+        step=k-self.swipeKey
+        gap=ticks_diff(now,self.swipeAt)
+        if self.swipeKey!=NO_KEY and (step==1 or step==-1) and SWIPE_MIN_MS<=gap<=SWIPE_GAP_MS:
+            if step==self.swipeDir:
+                self.swipeRun+=1
+            else:
+                self.swipeDir=step
+                self.swipeRun=2
+        else:
+            self.swipeDir=0
+            self.swipeRun=1
+        self.swipeKey=k
+        self.swipeAt=now
+        if self.swipeRun==SWIPE_KEYS:
+            # once per swipe however many keys it goes on over
+            self.listener.swipe(self.swipeDir)
+
+    def shake(self,k,level,now):
+        # follow the direction of the level, counting the changes
+        extreme=self.extreme[k]
+        if self.rising[k]:
+            if level>extreme:
+                self.extreme[k]=level
+                return
+            if extreme-level<self.tremolo_depth:
+                return
+            self.rising[k]=0
+        else:
+            if level<extreme:
+                self.extreme[k]=level
+                return
+            if level-extreme<self.tremolo_depth:
+                return
+            self.rising[k]=1
+        self.extreme[k]=level
+        if self.reversals[k] and ticks_diff(now,self.reversedAt[k])<=self.tremolo_ms:
+            if self.reversals[k]<255:
+                self.reversals[k]+=1
+        else:
+            self.reversals[k]=1
+        self.reversedAt[k]=now
+        if self.reversals[k]>=TREMOLO_REVERSALS and not self.trembling[k]:
+            self.trembling[k]=1
+            self.listener.tremolo(k,True)
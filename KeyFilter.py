@@ -0,0 +1,278 @@
+'''
+KeyFilter
+
+Cleans up the key readings before they are turned into levels.
+
+HampelFilter replaces a reading that is far from the median of the last
+WINDOW readings of its key with that median, so single glitches never reach
+the player. A real jump in distance is only held back for one reading.
+
+Calibration tracks the min/max of each key to normalise the readings to
+0..1. Any reading outside the range widens it straight away, as before, but
+each end then relaxes back by DECAY per reading towards the readings on its
+side, the min towards a hand over the key and the max towards the readings
+with nothing there, so a glitch which does get through doesn't spoil the
+resolution for the rest of the session. An idle key never pulls its min up
+and the range never relaxes narrower than MIN_SPAN. Calibrations can be saved to flash and loaded at startup.
+
+Crosstalk works on the levels of all the keys together. A finger over one
+key is also seen, further away, by the sensors either side. Each key has a
+weight per neighbour, the most of the neighbour's nearness (1-level) it has
+been seen to pick up, and a key whose nearness is no more than that, with a
+MARGIN, of a nearer neighbour's is taken to be seeing the neighbour and
+reads 1.0. The weights start at WEIGHT and are learnt by pressing the keys
+one at a time between startLearning() and stopLearning().
+
+Everything is held in fixed size arrays, the memory used only depends on the
+number of keys.
+'''
+import array
+import json
+
+WINDOW=3           # readings in the median window, odd
+THRESHOLD=3.0      # outlier when further than this many (scaled) MADs from the median
+MIN_DEVIATION=2.0  # cm, differences smaller than this are never outliers
+MAD_SCALE=1.4826   # makes the MAD comparable with a standard deviation
+
+DECAY=0.0002       # fraction the range relaxes towards each reading
+MIN_RANGE=5.0      # cm, narrower ranges are not calibrated yet
+MIN_SPAN=20.0      # cm, relaxing never narrows the range below this
+HAND_LEVEL=0.5     # a reading below this level is a hand over the key
+
+WEIGHT=0.3         # neighbour's nearness a key picks up until learnt
+MARGIN=1.25        # a key is suppressed within this factor of its weight
+LEARN_NEAR=0.8     # nearness of the pressed key when learning
+LEARN_RATIO=0.6    # and the most a neighbour may see of it, more is a hand between them
+MAX_WEIGHT=0.9     # most of a neighbour's nearness suppressed, margin included, so a key
+                   # touched outright is never hidden
+
+
+class HampelFilter():
+    def __init__(self,numKeys,window=WINDOW,threshold=THRESHOLD,min_deviation=MIN_DEVIATION):
+        self.window=window
+        self.threshold=threshold
+        self.min_deviation=min_deviation
+        self.values=array.array("f",[0.0]*(numKeys*window)) # ring per key
+        self.pos=bytearray(numKeys)
+        self.count=bytearray(numKeys)
+        self.sorted=array.array("f",[0.0]*window) # scratch
+        self.outliers=0 # readings replaced, for diagnostics
+
+    def median(self,base):
+        # median of a key's window, sorted in the scratch array
+        s=self.sorted
+        for i in range(self.window):
+            v=self.values[base+i]
+            j=i
+            while j>0 and s[j-1]>v:
+                s[j]=s[j-1]
+                j-=1
+            s[j]=v
+        return s[self.window//2]
+
+    def mad(self,base,med):
+        # median absolute deviation from med
+        s=self.sorted
+        for i in range(self.window):
+            v=abs(self.values[base+i]-med)
+            j=i
+            while j>0 and s[j-1]>v:
+                s[j]=s[j-1]
+                j-=1
+            s[j]=v
+        return s[self.window//2]
+
+    def filter(self,k,value):
+        # the reading to use for key k
+        base=k*self.window
+        self.values[base+self.pos[k]]=value
+        self.pos[k]=(self.pos[k]+1)%self.window
+        if self.count[k]<self.window:
+            self.count[k]+=1
+            return value
+        med=self.median(base)
+        limit=self.threshold*MAD_SCALE*self.mad(base,med)
+        if limit<self.min_deviation:
+            limit=self.min_deviation
+        if abs(value-med)>limit:
+            self.outliers+=1
+            return med
+        return value
+
+    def reset(self,k):
+        # forget the history of key k, e.g. after the sensor restarts
+        self.count[k]=0
+        self.pos[k]=0
+
+
+class Calibration():
+    def __init__(self,numKeys,decay=DECAY,min_range=MIN_RANGE,min_span=MIN_SPAN):
+        self.numKeys=numKeys
+        self.decay=decay
+        self.min_range=min_range
+        self.min_span=min_span
+        self.minLevel=array.array("f",[1000]*numKeys)
+        self.maxLevel=array.array("f",[0]*numKeys)
+
+    def normalise(self,k,value):
+        # map value to 0..1 range
+        # readings outside the range widen it, otherwise the end on the
+        # reading's side relaxes slowly towards it, down to min_span
+        lo=self.minLevel[k]
+        hi=self.maxLevel[k]
+        if value<lo:
+            lo=value
+        elif value>hi:
+            hi=value
+        elif hi-lo>self.min_span:
+            if value-lo<(hi-lo)*HAND_LEVEL:
+                # a hand over the key
+                lo+=(value-lo)*self.decay
+                if lo>hi-self.min_span:
+                    lo=hi-self.min_span
+            else:
+                hi-=(hi-value)*self.decay
+                if hi<lo+self.min_span:
+                    hi=lo+self.min_span
+        self.minLevel[k]=lo
+        self.maxLevel[k]=hi
+        return self.level(k,value)
+
+    def level(self,k,value):
+        # value in the 0..1 range without changing the range
+        lo=self.minLevel[k]
+        range=self.maxLevel[k]-lo
+        if range<self.min_range:
+            # not seen enough of the key yet
+            return 1.0
+        level=(value-lo)/range
+        if level>1.0:
+            return 1.0
+        if level<0.0:
+            return 0.0
+        return level
+
+    def save(self,path):
+        # needs the flash to be writable, see storage.remount() in boot.py
+        try:
+            with open(path,"w") as f:
+                json.dump({"min":list(self.minLevel),"max":list(self.maxLevel)},f)
+            return True
+        except OSError as e:
+            print("Calibration not saved to",path,e)
+            return False
+
+    def load(self,path):
+        try:
+            with open(path) as f:
+                profile=json.load(f)
+        except (OSError,ValueError):
+            return False
+        if len(profile["min"])!=self.numKeys or len(profile["max"])!=self.numKeys:
+            print("Calibration in",path,"is for a different number of keys")
+            return False
+        for k in range(self.numKeys):
+            self.minLevel[k]=profile["min"][k]
+            self.maxLevel[k]=profile["max"][k]
+        return True
+
+
+class Crosstalk():
+    def __init__(self,numKeys,adjacency=None,weight=WEIGHT,margin=MARGIN):
+        # adjacency lists the neighbours of each key, default the keys
+        # either side. The neighbours and weights are held as a fixed
+        # size kernel, width slots per key with -1 filling the spare ones
+        if adjacency is None:
+            adjacency=[[j for j in (k-1,k+1) if 0<=j<numKeys] for k in range(numKeys)]
+        self.numKeys=numKeys
+        self.margin=margin
+        self.maxWeight=MAX_WEIGHT/margin # learnt weights are kept below
+        self.width=max(len(near) for near in adjacency) if numKeys else 0
+        self.neighbours=array.array("h",[-1]*(numKeys*self.width))
+        for k in range(numKeys):
+            for i,j in enumerate(adjacency[k]):
+                self.neighbours[k*self.width+i]=j
+        self.weights=array.array("f",[min(weight,self.maxWeight)]*(numKeys*self.width))
+        self.nearness=array.array("f",[0.0]*numKeys) # scratch
+        self.learning=False
+        self.suppressed=0 # levels suppressed, for diagnostics
+
+    def apply(self,levels):
+        # suppress the keys in levels explained by a nearer neighbour
+        nearness=self.nearness
+        for k in range(self.numKeys):
+            nearness[k]=1.0-levels[k]
+        if self.learning:
+            self.learn()
+        neighbours=self.neighbours
+        weights=self.weights
+        width=self.width
+        margin=self.margin
+        for k in range(self.numKeys):
+            near=nearness[k]
+            if near<=0.0:
+                continue
+            base=k*width
+            for i in range(base,base+width):
+                j=neighbours[i]
+                if j<0:
+                    break
+                if nearness[j]>near and near<=weights[i]*margin*nearness[j]:
+                    levels[k]=1.0
+                    self.suppressed+=1
+                    break
+        return levels
+
+    def startLearning(self):
+        # forget the weights, then press the keys one at a time
+        for i in range(len(self.weights)):
+            self.weights[i]=0.0
+        self.learning=True
+
+    def stopLearning(self):
+        self.learning=False
+
+    def learn(self):
+        # the nearest key, if it is pressed, is the only one with a hand
+        # over it so what its neighbours see is crosstalk. A neighbour
+        # seeing nearly as much has the hand between them and is skipped
+        nearness=self.nearness
+        pressed=0
+        for k in range(1,self.numKeys):
+            if nearness[k]>nearness[pressed]:
+                pressed=k
+        if nearness[pressed]<LEARN_NEAR:
+            return
+        for k in range(self.numKeys):
+            base=k*self.width
+            for i in range(base,base+self.width):
+                if self.neighbours[i]==pressed:
+                    ratio=nearness[k]/nearness[pressed]
+                    if ratio>LEARN_RATIO:
+                        continue
+                    if ratio>self.maxWeight:
+                        ratio=self.maxWeight
+                    if ratio>self.weights[i]:
+                        self.weights[i]=ratio
+
+    def save(self,path):
+        try:
+            with open(path,"w") as f:
+                json.dump({"neighbours":list(self.neighbours),"weights":list(self.weights)},f)
+            return True
+        except OSError as e:
+            print("Crosstalk not saved to",path,e)
+            return False
+
+    def load(self,path):
+        try:
+            with open(path) as f:
+                profile=json.load(f)
+        except (OSError,ValueError):
+            return False
+        if profile["neighbours"]!=list(self.neighbours):
+            print("Crosstalk in",path,"is for different neighbours")
+            return False
+        for i in range(len(self.weights)):
+            self.weights[i]=min(profile["weights"][i],self.maxWeight)
+        return True
@@ -0,0 +1,79 @@
+'''
+LevelSmoother
+
+Smooths the key levels on their way to the mixer.
+
+Setting a voice level straight from each new reading makes the gain jump
+in steps, which is heard as zipper noise. Instead the readings set a target
+for each key and tick() moves every key towards its target at a fixed
+rate, TICK_MS, however often the sensors are read. Each step is a one pole
+filter (a fraction COEFF of the way) limited to at most SLEW.
+
+The levels are fixed point (ONE is 1.0) in an array so a tick does not
+allocate.
+
+    smoother=LevelSmoother.LevelSmoother(keyboard.getNumKeys())
+    smoother.setTarget(k,level)
+    if smoother.tick():
+        voice.level=smoother.level(k)
+
+'''
+import array
+
+from VL53_Keyboard import ticks_ms,ticks_diff,TICKS_MASK
+
+TICK_MS=4       # ms between level updates
+COEFF=0.25      # fraction of the way to the target per tick
+SLEW=0.1        # largest change per tick
+MAX_CATCHUP=16  # most ticks run by one call of tick() after a stall
+
+SHIFT=15
+ONE=1<<SHIFT
+
+
+class LevelSmoother():
+    def __init__(self,numKeys,tick_ms=TICK_MS,coeff=COEFF,slew=SLEW):
+        self.numKeys=numKeys
+        self.tick_ms=tick_ms
+        self.coeff=int(coeff*ONE)
+        self.slew=int(slew*ONE)
+        self.target=array.array("l",[0]*numKeys)
+        self.current=array.array("l",[0]*numKeys)
+        self.last=ticks_ms()
+
+    def setTarget(self,k,level):
+        self.target[k]=int(level*ONE)
+
+    def level(self,k):
+        return self.current[k]/ONE
+
+    def step(self):
+        # one tick of every key
+        for k in range(self.numKeys):
+            diff=self.target[k]-self.current[k]
+            if diff==0:
+                continue
+            move=(diff*self.coeff)>>SHIFT
+            if move==0:
+                move=diff # close enough, land on the target
+            if move>self.slew:
+                move=self.slew
+            elif move<-self.slew:
+                move=-self.slew
+            self.current[k]+=move
+
+    def tick(self):
+        # run the ticks due since the last call
+        # returns how many ran, 0 if the levels have not changed
+        now=ticks_ms()
+        ticks=ticks_diff(now,self.last)//self.tick_ms
+        if ticks<=0:
+            return 0
+        if ticks>MAX_CATCHUP:
+            ticks=MAX_CATCHUP
+            self.last=now
+        else:
+            self.last=(self.last+ticks*self.tick_ms)&TICKS_MASK
+        for i in range(ticks):
+            self.step()
+        return ticks
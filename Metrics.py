@@ -0,0 +1,130 @@
+'''
+Metrics
+
+Optional run time statistics for finding what is blowing the latency budget
+in the field. The players call loop() once per pass of their control loop
+and the Keyboard reports each sensor read. Every DUMP_MS a compact line
+starting with "#M" is printed on the serial console and the counts start
+again, tools/ReadMetrics.py turns a capture of the console into tables.
+
+    #M t=<ms> n=<loops> max=<us> hist=<h0>,..,<h15> gc=<count> low=<bytes> mux=<switches> keys=<reads>/<avg us>/<max us>/<misses>/<errors>;...
+
+hist[i] counts loops taking less than 2**i us, the last also counts the
+slower ones. A miss is a read attempted before the sensor's data was ready,
+reads which fail are counted as misses and errors. Garbage collections are
+spotted by the free memory going up between loops.
+
+The sensors may be read on another thread, see Acquisition, so the read
+counts are running totals only that side writes, each dump prints how far
+they have moved since the last. The slowest read is reset by the reading
+side once it sees a new interval has started.
+
+Timing uses time.monotonic_ns() which allocates a little on CircuitPython so
+leave "metrics" off in the players' CONFIG when not looking.
+'''
+import array
+import gc
+import time
+
+BUCKETS=16   # loop time histogram, up to 2**15us (32ms) and over
+DUMP_MS=5000 # ms between dumps
+WRAP=0xFFFFFFFF # the "L" totals wrap on the Pico
+
+
+class Metrics():
+    def __init__(self,keyboard,dump_ms=None):
+        # feeds itself from the keyboard's reads
+        # every DUMP_MS unless dump_ms is given, read now so it can be set
+        # after the import
+        self.keyboard=keyboard
+        keyboard.metrics=self
+        self.numKeys=keyboard.getNumKeys()
+        self.dump_us=(DUMP_MS if dump_ms is None else dump_ms)*1000
+
+        self.hist=array.array("L",[0]*BUCKETS)
+        # running totals, written by the side reading the sensors
+        self.reads=array.array("L",[0]*self.numKeys)
+        self.readTime=array.array("L",[0]*self.numKeys) # us
+        self.misses=array.array("L",[0]*self.numKeys)
+        self.errors=array.array("L",[0]*self.numKeys)
+        self.readMax=array.array("L",[0]*self.numKeys)  # us, this interval
+        self.maxOf=array.array("L",[0]*self.numKeys)    # interval of readMax
+        # the totals at the start of the interval
+        self.totals=(self.reads,self.readTime,self.misses,self.errors)
+        self.marks=[array.array("L",[0]*self.numKeys) for total in self.totals]
+        self.interval=0
+        self.start()
+
+    def now(self):
+        # us
+        return time.monotonic_ns()//1000
+
+    def start(self):
+        # start a new interval
+        for i in range(BUCKETS):
+            self.hist[i]=0
+        for total,mark in zip(self.totals,self.marks):
+            for k in range(self.numKeys):
+                mark[k]=total[k]
+        self.interval+=1
+        self.loops=0
+        self.loopMax=0
+        self.collections=0
+        self.memLow=self.memLast=gc.mem_free()
+        self.switches=self.keyboard.bus.switches
+        self.last=self.started=self.now()
+
+    def read(self,ch,us,ready):
+        # a sensor read taking us, ready False if there was no data
+        self.reads[ch]+=1
+        self.readTime[ch]+=us
+        if self.maxOf[ch]!=self.interval:
+            self.maxOf[ch]=self.interval
+            self.readMax[ch]=us
+        elif us>self.readMax[ch]:
+            self.readMax[ch]=us
+        if not ready:
+            self.misses[ch]+=1
+
+    def error(self,ch):
+        self.errors[ch]+=1
+
+    def loop(self):
+        # call once per pass of the control loop
+        t=self.now()
+        us=t-self.last
+        self.last=t
+        self.loops+=1
+        if us>self.loopMax:
+            self.loopMax=us
+        i=0
+        limit=1
+        while us>=limit and i<BUCKETS-1:
+            i+=1
+            limit<<=1
+        self.hist[i]+=1
+
+        mem=gc.mem_free()
+        if mem>self.memLast:
+            self.collections+=1
+        elif mem<self.memLow:
+            self.memLow=mem
+        self.memLast=mem
+
+        if t-self.started>=self.dump_us:
+            self.dump(t)
+
+    def dump(self,t=None):
+        # print the interval's statistics and start another
+        t=t or self.now()
+        keys=";".join(self.key(k) for k in range(self.numKeys))
+        print("#M t=%d n=%d max=%d hist=%s gc=%d low=%d mux=%d keys=%s"%(
+            t//1000,self.loops,self.loopMax,",".join(str(h) for h in self.hist),
+            self.collections,self.memLow,self.keyboard.bus.switches-self.switches,keys))
+        self.start()
+
+    def key(self,k):
+        # a key's reads/avg us/max us/misses/errors this interval
+        reads,us,misses,errors=((total[k]-mark[k])&WRAP for total,mark in zip(self.totals,self.marks))
+        slowest=self.readMax[k] if self.maxOf[k]==self.interval else 0
+        return "%d/%d/%d/%d/%d"%(reads,us//reads if reads else 0,slowest,misses,errors)
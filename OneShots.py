@@ -0,0 +1,169 @@
+'''
+OneShots
+
+Single hits played once per strike of a key, like a drum pad, rather than
+looped with their level following the key.
+
+Onsets watches the key levels for strikes. A key fires once as its level
+drops below on_level and can't fire again until it has risen back above
+off_level, so a hand held near the threshold doesn't machine gun. The
+velocity of a strike is how fast the level was falling at the reading which
+crossed, full_speed (levels per second) or faster is full velocity.
+
+SampleCache holds the hits in RAM as RawSamples so a strike starts at once,
+from an AssetBundle when there is one (see tools/PackAssets.py) otherwise
+read straight from the WAV files.
+
+HitVoices plays the hits on a few mixer voices taken in turn, so a fast
+retrigger lets the last hit ring on under the new one. Keys in the same
+choke group cut each other off, e.g. an open and closed hi-hat. The voices
+stop at the end of their sample so the mixer only renders hits which are
+sounding.
+
+    onsets=OneShots.Onsets(4,0.1,0.15,3.0)
+    samples=OneShots.SampleCache(["Music/tom-tom.wav",...])
+    hits=OneShots.HitVoices(mixer,first=4,count=4,choke=[None,None,0,0])
+    ...
+    velocity=onsets.update(k,levels[k],ticks_ms())
+    if velocity:
+        hits.hit(k,samples[k],velocity*0.2)
+'''
+import array
+import struct
+import audiocore
+from VL53_Keyboard import ticks_diff
+
+MIN_VELOCITY=0.2  # the softest strike, a slow touch still sounds
+MAX_GAP_MS=50     # the longest between readings, VL53_Keyboard.IDLE_BUDGET
+NO_KEY=255
+
+
+class Onsets():
+    def __init__(self,numKeys,on_level,off_level,full_speed):
+        self.on_level=on_level
+        self.off_level=off_level
+        self.full_speed=full_speed
+        self.armed=bytearray(b"\x01"*numKeys)
+        self.last=array.array("f",[1.0]*numKeys)    # level at the last reading
+        self.lastAt=array.array("l",[0]*numKeys)    # ticks ms the level last changed
+        self.speed=array.array("f",[0.0]*numKeys)   # levels per second, + approaching
+
+    def update(self,k,level,now):
+        # the velocity 0..1 if key k has just been struck, otherwise 0
+        # the levels are repeated between readings so speed only changes
+        # when the level does
+        if level!=self.last[k]:
+            # a steady level may have been read many times since it last
+            # changed, the change itself is within one reading
+            dt=ticks_diff(now,self.lastAt[k])
+            if dt>MAX_GAP_MS:
+                dt=MAX_GAP_MS
+            if dt>0:
+                self.speed[k]=(self.last[k]-level)*1000/dt
+            self.last[k]=level
+            self.lastAt[k]=now
+        if self.armed[k]:
+            if level<self.on_level:
+                self.armed[k]=0
+                velocity=self.speed[k]/self.full_speed
+                if velocity>1.0:
+                    return 1.0
+                return velocity if velocity>MIN_VELOCITY else MIN_VELOCITY
+        elif level>self.off_level:
+            self.armed[k]=1
+        return 0.0
+
+
+def readWave(path):
+    # a PCM WAV file as a RawSample in RAM
+    with open(path,"rb") as f:
+        riff,size,wave=struct.unpack("<4sI4s",f.read(12))
+        if riff!=b"RIFF" or wave!=b"WAVE":
+            raise ValueError(f"{path} is not a WAV file")
+        channels=rate=bits=None
+        while True:
+            header=f.read(8)
+            if len(header)<8:
+                raise ValueError(f"{path} has no data")
+            chunk,size=struct.unpack("<4sI",header)
+            if chunk==b"fmt ":
+                fmt=f.read(size)
+                channels,rate=struct.unpack_from("<HI",fmt,2)
+                bits=struct.unpack_from("<H",fmt,14)[0]
+            elif chunk==b"data" and bits:
+                data=array.array("B" if bits==8 else "h",bytes(size))
+                f.readinto(data)
+                return audiocore.RawSample(data,channel_count=channels,sample_rate=rate)
+            else:
+                f.seek(size+(size&1),1) # chunks are padded to even sizes
+
+
+class SampleCache():
+    # the hits preloaded, indexed like paths
+    def __init__(self,paths,bundle=None):
+        if bundle:
+            import AssetBundle
+            try:
+                bundle=AssetBundle.Bundle(bundle)
+            except OSError:
+                bundle=None # not packed, read the WAV files
+        self.samples=[]
+        for path in paths:
+            if bundle and path in bundle:
+                self.samples.append(bundle.load(path))
+            else:
+                self.samples.append(readWave(path))
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self,i):
+        return self.samples[i]
+
+
+class HitVoices():
+    # mixer voices first..first+count taken in turn by the hits
+    def __init__(self,mixer,first,count,choke=None):
+        self.mixer=mixer
+        self.first=first
+        self.count=count
+        self.choke=choke            # choke group per key, None for none
+        self.key=bytearray([NO_KEY]*count) # key which last played each voice
+        self.next=0
+
+    def hit(self,k,sample,level):
+        voice=self.mixer.voice
+        first=self.first
+        group=self.choke[k] if self.choke and k<len(self.choke) else None
+        if group is not None:
+            for v in range(self.count):
+                other=self.key[v]
+                if other!=NO_KEY and other<len(self.choke) and self.choke[other]==group:
+                    self.mixer.stop_voice(first+v)
+                    self.key[v]=NO_KEY
+        # the next free voice in turn, or the one which started longest ago
+        v=self.next
+        for i in range(self.count):
+            if not voice[first+v].playing:
+                break
+            v=v+1 if v+1<self.count else 0
+        else:
+            v=self.next
+        self.next=v+1 if v+1<self.count else 0
+        self.key[v]=k
+        voice[first+v].play(sample,loop=False)
+        voice[first+v].level=level
+
+    def level(self,k):
+        # the loudest voice still playing key k
+        voice=self.mixer.voice
+        loudest=0.0
+        for v in range(self.count):
+            if self.key[v]==k and voice[self.first+v].playing:
+                loudest=max(loudest,voice[self.first+v].level)
+        return loudest
+
+    def silence(self):
+        for v in range(self.count):
+            self.mixer.stop_voice(self.first+v)
+            self.key[v]=NO_KEY
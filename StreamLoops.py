@@ -0,0 +1,67 @@
+'''
+StreamLoops
+
+Backing loops streamed from flash through one shared allocation of buffers.
+
+audiocore.WaveFile reads its file a block at a time, double buffering through
+the buffer it is given, so a loop never has to fit in RAM. Left to itself
+each WaveFile allocates its own small buffers, on the heap wherever there is
+room. Here a single allocation, capped at MEMORY_LIMIT, is split into a
+double buffer per loop. Bigger blocks mean fewer flash reads, so the blocks
+are as big as the limit allows for the number of loops, up to BLOCK_SIZE,
+WaveFile takes a buffer of at most 1024 bytes.
+
+    loops=StreamLoops.Loops(["Music/loop2.wav"])
+    loops.play(mixer,first_voice=8,level=0.1)
+
+'''
+from audiocore import WaveFile
+
+BLOCK_SIZE=512       # bytes, the largest half of a loop's double buffer
+MIN_BLOCK_SIZE=256   # bytes, smaller than this and the flash can't keep up
+MEMORY_LIMIT=16*1024 # bytes for the buffers of all the loops
+
+
+class BufferPool():
+    # one allocation split into equal sized double buffers, one per loop
+    def __init__(self,count,limit=MEMORY_LIMIT,block_size=BLOCK_SIZE):
+        # as big a block as fits count double buffers in the limit
+        block=min(block_size,limit//(2*max(count,1)))
+        block-=block%4 # keep whole stereo 16 bit frames
+        if block<MIN_BLOCK_SIZE:
+            raise MemoryError(f"StreamLoops: {count} loops need {2*count*MIN_BLOCK_SIZE} bytes, MEMORY_LIMIT is {limit}")
+        self.block_size=block
+        self.memory=bytearray(2*block*count)
+
+    def buffer(self,i):
+        # the double buffer of loop i
+        size=2*self.block_size
+        return memoryview(self.memory)[i*size:(i+1)*size]
+
+
+class Loops():
+    # WAV files streamed from flash, sharing a BufferPool
+    def __init__(self,paths,limit=MEMORY_LIMIT,block_size=BLOCK_SIZE):
+        self.paths=paths
+        self.pool=BufferPool(len(paths),limit,block_size)
+        self.waves=[None]*len(paths)
+        print(f"StreamLoops: {len(paths)} loops, {self.pool.block_size} byte blocks")
+
+    def open(self,i):
+        # the WaveFile for loop i, opened on first use
+        if self.waves[i] is None:
+            self.waves[i]=WaveFile(open(self.paths[i],"rb"),self.pool.buffer(i))
+        return self.waves[i]
+
+    def play(self,mixer,first_voice=0,level=1.0):
+        # play every loop on consecutive mixer voices
+        for i in range(len(self.paths)):
+            voice=mixer.voice[first_voice+i]
+            voice.play(self.open(i),loop=True)
+            voice.level=level
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self,i):
+        return self.open(i)
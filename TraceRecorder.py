@@ -0,0 +1,194 @@
+'''
+TraceRecorder
+
+Records what the sensors returned so field problems can be reproduced, and
+plays recordings back through the Keyboard in place of the sensors.
+
+Recorder keeps the raw distance of every reading in a fixed size ring
+buffer, the oldest readings are overwritten once it is full. Attach it with
+
+    recorder=TraceRecorder.Recorder(keyboard)
+
+then save() it to flash or dump() it to the serial console, where it is
+printed as "#T" lines of hex which read() accepts from a console capture.
+
+Replay feeds a recording to the Keyboard, at the original speed or faster,
+through stand in sensors. The keyboard runs on the replay's clock so its
+scheduling matches the recording however fast it is played. The clock
+starts with the keyboard's first poll(), not while the player is still
+starting up, and every reading of a key is delivered, in order, however
+late the keyboard gets to it, so a replay always feeds the same readings.
+
+    keyboard=VL53_Keyboard.Keyboard(None,None,None,replay=TraceRecorder.Replay(*TraceRecorder.read("trace.vlt"),speed=4))
+
+Recording format, little endian
+
+    b"VLT1" u8 keys u32 count
+    count x (u32 ticks ms, u8 key, u16 distance mm)
+'''
+import array
+import struct
+import binascii
+from VL53_Keyboard import ticks_ms,ticks_diff,TICKS_MASK
+
+MAGIC=b"VLT1"
+HEADER="<4sBI"
+RECORD="<IBH"
+RECORD_BYTES=7
+RECORDS=4096      # readings kept, 28K of RAM
+DUMP_RECORDS=32   # readings per "#T" line
+MAX_MM=65535
+
+
+class Recorder():
+    def __init__(self,keyboard,records=RECORDS):
+        # records every reading the keyboard takes
+        self.numKeys=keyboard.getNumKeys()
+        self.size=records
+        self.buffer=bytearray(records*RECORD_BYTES)
+        self.pos=0        # next record written
+        self.count=0      # records held
+        keyboard.recorder=self
+
+    def record(self,ch,now,distance):
+        # distance in cm, as the VL53L0X driver returns it
+        mm=int(distance*10)
+        if mm>MAX_MM:
+            mm=MAX_MM
+        elif mm<0:
+            mm=0
+        struct.pack_into(RECORD,self.buffer,self.pos*RECORD_BYTES,now,ch,mm)
+        self.pos+=1
+        if self.pos==self.size:
+            self.pos=0
+        if self.count<self.size:
+            self.count+=1
+
+    def clear(self):
+        self.pos=0
+        self.count=0
+
+    def chunks(self):
+        # the recorded bytes oldest first, without copying the buffer
+        view=memoryview(self.buffer)
+        if self.count<self.size:
+            return (view[:self.pos*RECORD_BYTES],)
+        return (view[self.pos*RECORD_BYTES:],view[:self.pos*RECORD_BYTES])
+
+    def header(self):
+        return struct.pack(HEADER,MAGIC,self.numKeys,self.count)
+
+    def write(self,f):
+        f.write(self.header())
+        for chunk in self.chunks():
+            f.write(chunk)
+
+    def save(self,path):
+        # needs the flash to be writable, see storage.remount() in boot.py
+        try:
+            with open(path,"wb") as f:
+                self.write(f)
+            return True
+        except OSError as e:
+            print("Trace not saved to",path,e)
+            return False
+
+    def dump(self):
+        # print the recording on the serial console
+        print("#T",binascii.hexlify(self.header()).decode())
+        step=DUMP_RECORDS*RECORD_BYTES
+        for chunk in self.chunks():
+            for i in range(0,len(chunk),step):
+                print("#T",binascii.hexlify(chunk[i:i+step]).decode())
+
+
+def parse(data):
+    # (keys,[(ticks,key,mm),...]) from the bytes of a recording
+    magic,numKeys,count=struct.unpack_from(HEADER,data,0)
+    if magic!=MAGIC:
+        raise ValueError("Not a trace recording")
+    offset=struct.calcsize(HEADER)
+    records=[]
+    for i in range(count):
+        records.append(struct.unpack_from(RECORD,data,offset+i*RECORD_BYTES))
+    return numKeys,records
+
+
+def read(path):
+    # a recording saved to flash, or a console capture with "#T" lines
+    with open(path,"rb") as f:
+        data=f.read()
+    if not data.startswith(MAGIC):
+        data=b"".join(binascii.unhexlify(line.strip()[3:]) for line in data.splitlines()
+                      if line.startswith(b"#T "))
+    return parse(data)
+
+
+class ReplaySensor():
+    # a VL53L0X returning one key of a recording
+    def __init__(self,replay,times,distances):
+        self.replay=replay
+        self.times=times
+        self.distances=distances
+        self.pos=0
+        self.measurement_timing_budget=0 # set by the keyboard, the recording sets the pace
+        self.io_timeout_s=0
+
+    def start_continuous(self):
+        pass
+
+    def stop_continuous(self):
+        pass
+
+    @property
+    def data_ready(self):
+        return self.pos<len(self.times) and ticks_diff(self.replay.ticks(),self.times[self.pos])>=0
+
+    @property
+    def distance(self):
+        # the next reading, in cm, none are skipped
+        pos=self.pos
+        self.pos=pos+1
+        return self.distances[pos]/10
+
+    def finished(self):
+        return self.pos>=len(self.times)
+
+
+class Replay():
+    def __init__(self,numKeys,records,speed=1.0):
+        # records as returned by read(), speed 2 plays twice as fast
+        self.numKeys=numKeys
+        self.speed=speed
+        self.started=None
+        start=records[0][0] if records else 0
+        times=[array.array("l") for k in range(numKeys)]
+        distances=[array.array("H") for k in range(numKeys)]
+        self.end=0
+        for when,k,mm in records:
+            if k<numKeys:
+                t=ticks_diff(when,start)
+                times[k].append(t)
+                distances[k].append(mm)
+                self.end=max(self.end,t)
+        self.sensors=[ReplaySensor(self,times[k],distances[k]) for k in range(numKeys)]
+
+    def start(self):
+        # called by the keyboard's first poll()
+        self.started=ticks_ms()
+
+    def ticks(self):
+        # ms into the recording, 0 until start()
+        if self.started is None:
+            return 0
+        return int(ticks_diff(ticks_ms(),self.started)*self.speed)&TICKS_MASK
+
+    def sensor(self,ch):
+        return self.sensors[ch]
+
+    def finished(self):
+        # every reading delivered
+        for sensor in self.sensors:
+            if not sensor.finished():
+                return False
+        return True
@@ -0,0 +1,127 @@
+'''
+Transport
+
+A musical clock so loops and phrases can be started and stopped in time.
+
+CircuitPython's audiomixer doesn't say how many samples it has played so
+the clock is ticks_ms() since start(), called as the mixer starts, scaled by
+the mixer's sample rate. ticks_ms() and the I2S clock come from the same
+crystal so they don't drift apart, and a millisecond is well inside a beat.
+
+Triggers are quantised to the next "beat" or "bar". Each mixer voice can
+have one start or stop pending, poll() from the control loop carries them
+out once their time comes.
+
+ticks_diff() only reaches 2**28 ms, about 3 days, so once the clock passes
+REANCHOR_MS poll() moves beat 0 on by a whole number of bars. The beats
+and bars then count from there, the timing carries on unchanged.
+
+    transport=Transport.Transport(mixer,tempo=120)
+    transport.start()
+    transport.trigger(voice,sample,"bar") # start on the next bar
+    transport.trigger(voice,None,"beat")  # stop on the next beat
+    ...
+    transport.poll()
+'''
+import array
+from VL53_Keyboard import ticks_ms,ticks_diff,TICKS_MASK
+
+TEMPO=120        # beats per minute
+BEATS_PER_BAR=4
+REANCHOR_MS=1<<27 # ms, half what ticks_diff() can measure
+
+NONE=0
+START=1
+STOP=2
+
+
+class Transport():
+    def __init__(self,mixer,tempo=TEMPO,beats_per_bar=BEATS_PER_BAR):
+        self.mixer=mixer
+        self.sample_rate=mixer.sample_rate
+        self.beats_per_bar=beats_per_bar
+        self.setTempo(tempo)
+
+        # the pending trigger of each voice, due in ms since start()
+        voices=len(mixer.voice)
+        self.action=bytearray(voices)
+        self.due=array.array("l",[0]*voices)
+        self.samples=[None]*voices
+        self.loop=bytearray(voices)
+        self.origin=None # set by start()
+
+    def start(self):
+        # beat 0 is now, call as the mixer starts playing
+        self.origin=ticks_ms()
+
+    def reanchor(self,now):
+        # move beat 0 on by the whole bars up to now, ms since start()
+        # returns the ms it moved, the sub ms remainder is dropped
+        bar_ms=self.beat_ms*self.beats_per_bar
+        shift=int(now//bar_ms*bar_ms+0.5)
+        self.origin=(self.origin+shift)&TICKS_MASK
+        due=self.due
+        for v in range(len(due)):
+            if self.action[v]:
+                due[v]-=shift
+        return shift
+
+    def setTempo(self,tempo):
+        self.tempo=tempo
+        self.beat_ms=60000/tempo
+
+    def elapsed(self):
+        # ms since start()
+        return ticks_diff(ticks_ms(),self.origin)
+
+    def position(self):
+        # samples played since start()
+        return self.elapsed()*self.sample_rate//1000
+
+    def beat(self):
+        # beats since start(), with the fraction through the current beat
+        return self.elapsed()/self.beat_ms
+
+    def bar(self):
+        return int(self.beat())//self.beats_per_bar
+
+    def next(self,quantum):
+        # ms since start() of the next "beat" or "bar"
+        step=self.beat_ms*(self.beats_per_bar if quantum=="bar" else 1)
+        return int((self.elapsed()//step+1)*step)
+
+    def trigger(self,voice,sample,quantum="bar",loop=True):
+        # play sample on the mixer voice from the next quantum, or stop
+        # the voice if sample is None, replacing anything pending
+        # starting a voice which is still playing, with a stop pending,
+        # just cancels the stop so it carries on in time
+        if sample is not None and self.action[voice]==STOP and self.mixer.voice[voice].playing:
+            self.action[voice]=NONE
+            return
+        self.action[voice]=STOP if sample is None else START
+        self.samples[voice]=sample
+        self.loop[voice]=loop
+        self.due[voice]=self.next(quantum)
+
+    def cancel(self,voice):
+        self.action[voice]=NONE
+        self.samples[voice]=None
+
+    def pending(self,voice):
+        # NONE, START or STOP
+        return self.action[voice]
+
+    def poll(self):
+        # carry out the triggers which are due
+        now=self.elapsed()
+        if now>=REANCHOR_MS:
+            now-=self.reanchor(now)
+        action=self.action
+        for v in range(len(action)):
+            if action[v] and now>=self.due[v]:
+                if action[v]==START:
+                    self.mixer.voice[v].play(self.samples[v],loop=self.loop[v]==1)
+                else:
+                    self.mixer.stop_voice(v)
+                action[v]=NONE
+                self.samples[v]=None
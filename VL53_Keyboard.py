@@ -1,8 +1,34 @@
 '''
 VL53_Keyboard
 
-Normalises the key readings by dynamically adjusting the min/max
+Normalises the key readings by dynamically adjusting the min/max, after
+filtering out glitches, see KeyFilter. The min/max calibration can be saved
+with saveCalibration() and is loaded again at startup.
 
+The sensors free run in continuous mode so a new measurement only becomes
+available once per timing budget. poll() only talks to the channels whose
+measurement is due and getAllLevels() returns the latest snapshot so the
+players don't wait on a full sweep of the I2C bus every time round their loop.
+
+Up to 7 muxes can be chained, see TOPOLOGY.
+
+With staged=True the sensors are brought up one per poll() instead of all
+in Keyboard(), so the caller can get its audio going first.
+
+Keys picking up a finger over their neighbour are suppressed, see
+KeyFilter.Crosstalk and ADJACENCY.
+
+The raw readings can be recorded, and a recording played back in place of
+the sensors, see TraceRecorder.
+
+Each key has its own timing budget. A key with a hand near it ranges at
+FAST_BUDGET so it responds quickly, once nothing has been near it for
+IDLE_AFTER_MS it drops back to IDLE_BUDGET to save bus traffic. A sensor
+which stops producing measurements has its ranging restarted.
+
+A sensor which keeps failing is taken out of the scan and its last level
+is kept. It is reinitialised in the background, backing off up to
+MAX_BACKOFF_MS between attempts, so one bad key doesn't hold up the others.
 
 '''
 from adafruit_tca9548a import TCA9548A,TCA9548A_Channel
@@ -11,122 +37,478 @@ import busio
 import board
 from digitalio import DigitalInOut,Direction,Pull
 import sys
+import time
+import array
+import KeyFilter
+
+try:
+    # allocation free millisecond ticks on CircuitPython
+    from supervisor import ticks_ms
+except ImportError:
+    def ticks_ms():
+        return (time.monotonic_ns()//1000000)&TICKS_MASK
 
 NUM_KEYS=8 	# also number of channels on the MUX
 
+# (mux address, channels with sensors) for each mux
+# up to 7 TCA9548A, 0x70..0x76, can share the bus giving 56 keys
+TOPOLOGY=[(0x70,range(NUM_KEYS))]
+
+NO_CHANNEL=b"\x00" # written to a mux to deselect all its channels
+
+TIMING_BUDGET=33000 # us, per sensor measurement when not ADAPTIVE
+ADAPTIVE=True       # change each key's budget to suit what it sees
+FAST_BUDGET=20000   # us, while a hand is near, the shortest the VL53L0X allows
+IDLE_BUDGET=50000   # us, while nothing is near
+NEAR_LEVEL=0.9      # a level below this is a hand near the key
+IDLE_AFTER_MS=1000  # go back to IDLE_BUDGET after this long with nothing near
+IO_TIMEOUT=0.2      # s, longest a sensor read may wait, 0 waits forever
+STALL_BUDGETS=4     # restart ranging after this many budgets without a reading
+FAIL_LIMIT=3        # errors in a row before a sensor is reinitialised
+BACKOFF_MS=100      # wait before the first reinitialise, doubling each attempt
+MAX_BACKOFF_MS=5000 # longest wait between attempts
+
+REPLAY=None # a TraceRecorder.Replay played instead of the sensors, e.g. by hostsim
+RETRY_MS=2          # recheck a channel this soon if its data was not ready
+MAX_READS=4         # most sensors read by one poll() so the caller's loop keeps going
+I2C_FREQUENCY=400000 # Hz, the VL53L0X and TCA9548A both run at 400kHz
+CALIBRATION_FILE="/calibration.json" # saved min/max of the keys
+CROSSTALK=True      # suppress keys seeing a finger over their neighbour
+ADJACENCY=None      # neighbours of each key e.g. [[1],[0,2],...], None for the keys either side
+CROSSTALK_FILE="/crosstalk.json" # learnt crosstalk weights
+
+# ticks_ms() wraps at 2**29 so they stay small ints
+TICKS_PERIOD=1<<29
+TICKS_MASK=TICKS_PERIOD-1
+TICKS_HALF=TICKS_PERIOD//2
+
+
+def ticks_diff(t1,t2):
+    # signed difference t1-t2 allowing for wrap around
+    diff=(t1-t2)&TICKS_MASK
+    return ((diff+TICKS_HALF)&TICKS_MASK)-TICKS_HALF
+
+
+class MuxBus():
+    # which mux channel is switched onto the I2C bus
+    # every sensor has the same address so only one channel on one
+    # mux may be selected at a time
+    def __init__(self):
+        self.channel=None # MuxChannel currently selected
+        self.switches=0   # number of mux writes, for diagnostics
+
+
+class MuxChannel(TCA9548A_Channel):
+    # a mux channel which leaves itself selected after use
+    # the adafruit channel deselects the mux on every unlock() so each
+    # I2C transaction costs an extra two writes to the mux. Here the bus
+    # remembers which channel is selected and only switches when needed
+    def __init__(self,tca,channel):
+        super().__init__(tca,channel)
+        self.channel=channel
+
+    def try_lock(self):
+        while not self.tca.i2c.try_lock():
+            pass
+        bus=self.tca.bus
+        if bus.channel is not self:
+            if bus.channel is not None and bus.channel.tca is not self.tca:
+                # turn off the other mux first
+                self.tca.i2c.writeto(bus.channel.tca.address,NO_CHANNEL)
+                bus.switches+=1
+            self.tca.i2c.writeto(self.tca.address,self.channel_switch)
+            bus.channel=self
+            bus.switches+=1
+        return True
+
+    def unlock(self):
+        # leave the channel selected for the next read
+        return self.tca.i2c.unlock()
+
+
+class Mux(TCA9548A):
+    # TCA9548A handing out MuxChannels, muxes on the same I2C share a bus
+    def __init__(self,i2c,address=0x70,bus=None):
+        super().__init__(i2c,address)
+        self.bus=bus or MuxBus()
+
+    def __getitem__(self,key):
+        if not 0<=key<=7:
+            raise IndexError("Channel must be an integer in the range: 0-7.")
+        if self.channels[key] is None:
+            self.channels[key]=MuxChannel(self,key)
+        return self.channels[key]
+
 
 class Keyboard():
-    def __init__(self,SDA,SCL,RST):
+    def __init__(self,SDA,SCL,RST,topology=None,replay=None,staged=False):
         # pins should be like board.GP2,board.GP3,board.GP4
-        self.reset_pin=DigitalInOut(RST)
-        self.reset_pin.direction=Direction.OUTPUT
-        self.reset_pin.value=1 # Low to reset
-
-        # as keys are read the min/max readings are updated
-        # so that a 0..1 range can be calculated later
-        self.minLevel=[1000]*NUM_KEYS	 # adjusted when keys are read
-        self.maxLevel=[0]*NUM_KEYS       # ditto
-        
+        # topology lists the muxes and the channels with sensors
+        # e.g. [(0x70,range(8)),(0x71,range(8))] for 16 keys
+        # keys are numbered in that order, default TOPOLOGY
+        # replay plays a recording instead, no hardware is used
+        # staged leaves starting the sensors to poll(), see startSensor()
+        topology=topology or TOPOLOGY
+        self.replay=replay or REPLAY
+        self.reset_pin=None
+        if self.replay:
+            self.numKeys=self.replay.numKeys
+            self.ticks=self.replay.ticks # the recording's clock
+        else:
+            self.reset_pin=DigitalInOut(RST)
+            self.reset_pin.direction=Direction.OUTPUT
+            self.reset_pin.value=1 # Low to reset
+            self.numKeys=sum(len(channels) for address,channels in topology)
+            self.ticks=ticks_ms
+
+        # readings are filtered for glitches then the min/max readings
+        # are updated so that a 0..1 range can be calculated
+        # arrays so the updates in the control loop don't allocate
+        self.filter=KeyFilter.HampelFilter(self.numKeys)
+        self.calibration=KeyFilter.Calibration(self.numKeys)
+        if self.calibration.load(CALIBRATION_FILE):
+            print("Loaded calibration",CALIBRATION_FILE)
+        self.minLevel=self.calibration.minLevel	 # adjusted when keys are read
+        self.maxLevel=self.calibration.maxLevel  # ditto
+
+        # then the keys seeing a neighbour's finger are suppressed, only
+        # when there are new readings, into levels for getAllLevels()
+        self.crosstalk=None
+        if CROSSTALK:
+            self.crosstalk=KeyFilter.Crosstalk(self.numKeys,ADJACENCY)
+            if self.crosstalk.load(CROSSTALK_FILE):
+                print("Loaded crosstalk",CROSSTALK_FILE)
+        self.levels=array.array("f",[0.0]*self.numKeys)
+        self.levelsAt=-1 # updates when levels was worked out
+
         # last valid reading
         # if not data_ready then this value is used
         # updated as keys are read
-        self.cache=[0.0]*NUM_KEYS 
+        self.cache=array.array("f",[0.0]*self.numKeys)
+
+        # count of readings taken, callers can compare it with the
+        # count they last saw to know if any level has changed
+        self.updates=0
+
+        # when each sensor is next expected to have a reading (ms ticks)
+        # and the keys in the order they are due, so a poll only looks
+        # at the keys which are due however many keys there are
+        budget=IDLE_BUDGET if ADAPTIVE else TIMING_BUDGET
+        self.budget_ms=array.array("l",[budget//1000]*self.numKeys)
+        self.due=array.array("l",[self.ticks()]*self.numKeys)
+        self.order=list(range(self.numKeys))
+
+        # when each key last had a reading and last saw a hand near it
+        self.lastRead=array.array("l",[self.ticks()]*self.numKeys)
+        self.nearAt=array.array("l",[self.ticks()]*self.numKeys)
+        self.restarts=0 # stalled sensors restarted, for diagnostics
+
+        # errors in a row for each sensor, FAIL_LIMIT or more has failed
+        self.errors=bytearray(self.numKeys)
+        self.faults=0   # read errors, for diagnostics
 
-        # create the mux
+        self.metrics=None  # set by Metrics.Metrics(keyboard)
+        self.recorder=None # set by TraceRecorder.Recorder(keyboard)
+
+        self.bus=MuxBus()
+        self.tsl=[None]*self.numKeys
+        self.pending=self.numKeys # sensors not started yet
+        if self.replay:
+            self.channels=[]
+            for k in range(self.numKeys):
+                self.initSensor(k,budget)
+            return
+
+        # create the muxes
         try:
-            self.i2c=busio.I2C(SCL,SDA) # MUX
-            self.mux=TCA9548A(self.i2c) # using default MUX address 0x70
+            self.i2c=busio.I2C(SCL,SDA,frequency=I2C_FREQUENCY) # MUX
+            self.muxes=[Mux(self.i2c,address,self.bus) for address,channels in topology]
+            self.mux=self.muxes[0]
         except Exception as e:
             sys.exit(f"EXCEPTION: Unable to setup the MIDI Keyboard")
 
+        # the muxes keep their channels over a soft reload, which the
+        # reset pin would clear, so turn them all off before using them
+        self.deselectAll()
+
         # associate the 'key' sensors to the device channels
-        self.tsl=[None]*NUM_KEYS
-        for ch in range(NUM_KEYS):
-            self.tsl[ch]=VL53L0X(self.mux[ch])
+        self.channels=[]
+        for m in range(len(topology)):
+            for ch in topology[m][1]:
+                self.channels.append(self.muxes[m][ch])
+        if staged:
+            return
+        for k in range(self.numKeys):
             # all the sensors run in parallel
-            self.tsl[ch].start_continuous()
-            self.tsl[ch].measurement_timing_budget = 33000 # us 
-            #self.tsl[ch].io_timeout_s=0.02 # 2x timing budget
+            try:
+                self.initSensor(k,budget)
+            except Exception as e:
+                print(f"Key {k} not responding, retrying in the background",e)
+                self.bus.channel=None
+                self.errors[k]=FAIL_LIMIT
+
+    def initSensor(self,ch,budget):
+        # (re)create the sensor and start it ranging, budget in us
+        if self.replay:
+            tsl=self.replay.sensor(ch)
+        else:
+            tsl=VL53L0X(self.channels[ch],io_timeout_s=IO_TIMEOUT)
+        tsl.measurement_timing_budget=budget
+        tsl.start_continuous()
+        if self.tsl[ch] is None:
+            self.pending-=1
+        self.tsl[ch]=tsl
+        self.budget_ms[ch]=budget//1000
+        self.lastRead[ch]=self.ticks()
 
     def scanChannels(self):
         # check for sensors on each mux port
-        for ch in range(NUM_KEYS):
-            if self.mux[ch].try_lock():
-                print(f"Ch {ch}, end=''")
-                addresses = self.mux[channel].scan()
-                print([hex(address) for address in addresses if address != 0x70])
-                self.mux[channel].unlock()
+        for k in range(len(self.channels)):
+            channel=self.channels[k]
+            if channel.try_lock():
+                print(f"Key {k} mux {hex(channel.tca.address)} ch {channel.channel} ",end="")
+                addresses = channel.tca.i2c.scan()
+                print([hex(address) for address in addresses if address<0x70 or address>0x77])
+                channel.unlock()
                 
     
     def normalise(self,ch,value):
-        # map value to 0..1 range
-        # check if value is outside the current range
-        # if so adjust the range
-        
-        #print(f"Normalise value {value} min {self.minLevel[ch]} max {self.maxLevel[ch]}")
-                    
-        if value < self.minLevel[ch]:
-            # update the minLevel
-            self.minLevel[ch]=value
-            
-        elif value > self.maxLevel[ch]:
-            self.maxLevel[ch]=value
+        # map value to 0..1 range adjusting the range, see KeyFilter
+        # not rounded, steps in the level are heard as zipper noise
+        return self.calibration.normalise(ch,value)
 
-        # return normalised value
+    def learnCrosstalk(self,on=True):
+        # while on press the keys one at a time, save with saveCalibration()
+        if self.crosstalk:
+            if on:
+                self.crosstalk.startLearning()
+            else:
+                self.crosstalk.stopLearning()
 
-        range=self.maxLevel[ch]-self.minLevel[ch]
-        if range>0:
-            return round((value-self.minLevel[ch])/range,2)
-        # (val-min)/range would be an infinite value
-        return 1.0
-        
-    def getAllLevels(self):
-        # read all the sensors and return a list of readings
-        # sensor must be calibrated so they produce the same range 0..MAX_DIST
-        levels=[0]*NUM_KEYS
-        for ch in range(NUM_KEYS):
-            
-            if self.tsl[ch].data_ready:
+    def saveCalibration(self,path=CALIBRATION_FILE,crosstalk_path=CROSSTALK_FILE):
+        # keep the min/max, and crosstalk weights, for the next session
+        saved=self.calibration.save(path)
+        if self.crosstalk:
+            saved=self.crosstalk.save(crosstalk_path) and saved
+        return saved
+
+    def deselectAll(self):
+        # turn off every mux, for when which channel is on isn't known
+        self.bus.channel=None
+        if self.replay:
+            return
+        while not self.i2c.try_lock():
+            pass
+        try:
+            for mux in self.muxes:
                 try:
-                    norm=self.normalise(ch,self.tsl[ch].distance)
-                
-                    # there are glitches when the output is 90% less
-                    # if that happens in one pass it's a glitch
-                    if norm<0.1*levels[ch]:
-                        levels[ch]=self.cache[ch]
-                    else:
-                        levels[ch]=norm
-                        self.cache[ch]=norm
-                except:
-                    levels[ch]=self.cache[ch]        
+                    self.i2c.writeto(mux.address,NO_CHANNEL)
+                    self.bus.switches+=1
+                except OSError:
+                    pass # carry on with the others
+        finally:
+            self.i2c.unlock()
+
+    def restart(self,ch,budget=None):
+        # restart the sensor's continuous ranging, with a new budget (us)
+        tsl=self.tsl[ch]
+        tsl.stop_continuous()
+        if budget is not None:
+            tsl.measurement_timing_budget=budget
+            self.budget_ms[ch]=budget//1000
+        tsl.start_continuous()
+        self.lastRead[ch]=self.ticks()
+
+    def adaptBudget(self,ch,level,now):
+        # fast while a hand is near the key, idle once it has gone
+        if level<NEAR_LEVEL:
+            self.nearAt[ch]=now
+            if self.budget_ms[ch]!=FAST_BUDGET//1000:
+                self.restart(ch,FAST_BUDGET)
+        elif self.budget_ms[ch]!=IDLE_BUDGET//1000 and ticks_diff(now,self.nearAt[ch])>IDLE_AFTER_MS:
+            self.restart(ch,IDLE_BUDGET)
+
+    def fault(self,ch,now):
+        # a sensor failed, its cached level is kept
+        self.faults+=1
+        if self.metrics:
+            self.metrics.error(ch)
+        # the channel which failed may still be on, and switching to
+        # another mux wouldn't turn it off, so turn them all off
+        self.deselectAll()
+        errors=self.errors[ch]
+        if errors<255:
+            self.errors[ch]=errors+1
+        if errors+1<FAIL_LIMIT:
+            self.due[ch]=(now+self.budget_ms[ch])&TICKS_MASK
+            return
+        if errors+1==FAIL_LIMIT:
+            print(f"Key {ch} failed, retrying in the background")
+        # back off before trying to reinitialise it
+        shift=errors+1-FAIL_LIMIT
+        backoff=MAX_BACKOFF_MS if shift>16 else min(BACKOFF_MS<<shift,MAX_BACKOFF_MS)
+        self.due[ch]=(now+backoff)&TICKS_MASK
+
+    def recover(self,ch,now):
+        # try to bring back a failed sensor
+        try:
+            self.initSensor(ch,IDLE_BUDGET if ADAPTIVE else TIMING_BUDGET)
+        except Exception:
+            self.fault(ch,now)
+            return False
+        print(f"Key {ch} recovered")
+        self.errors[ch]=0
+        self.filter.reset(ch)
+        self.due[ch]=(now+self.budget_ms[ch])&TICKS_MASK
+        return False
+
+    def startSensor(self,ch,now):
+        # bring up a sensor left by a staged Keyboard()
+        try:
+            self.initSensor(ch,IDLE_BUDGET if ADAPTIVE else TIMING_BUDGET)
+        except Exception as e:
+            print(f"Key {ch} not responding",e)
+            self.errors[ch]=FAIL_LIMIT-1
+            self.fault(ch,now)
+            return False
+        self.due[ch]=(now+self.budget_ms[ch])&TICKS_MASK
+        return False
+
+    def ready(self):
+        # True once every sensor has been started
+        return self.pending==0
+
+    def healthy(self,ch):
+        return self.errors[ch]<FAIL_LIMIT
+
+    def readChannel(self,ch,now):
+        # read one sensor if it has a measurement, return True if it did
+        if self.errors[ch]>=FAIL_LIMIT:
+            return self.recover(ch,now)
+        if self.tsl[ch] is None:
+            return self.startSensor(ch,now)
+        try:
+            if not self.tsl[ch].data_ready:
+                if self.replay is None and ticks_diff(now,self.lastRead[ch])>STALL_BUDGETS*self.budget_ms[ch]:
+                    # the sensor has stopped ranging, which counts
+                    # against it in case restarting doesn't help
+                    self.restarts+=1
+                    self.errors[ch]+=1
+                    self.restart(ch)
+                    # no reading, the first of the new ranging is a budget away
+                    self.due[ch]=(now+self.budget_ms[ch])&TICKS_MASK
+                    return False
+                else:
+                    # nearly due, try again shortly
+                    self.due[ch]=(now+RETRY_MS)&TICKS_MASK
+                    return False
             else:
-                # if there's no data ready used the last reading to
-                # smooth the changes
-                # print("data not ready")
-                levels[ch]=self.cache[ch]
-                
+                raw=self.tsl[ch].distance
+                if self.recorder:
+                    self.recorder.record(ch,now,raw)
+                self.cache[ch]=self.normalise(ch,self.filter.filter(ch,raw))
+                self.lastRead[ch]=now
+                self.errors[ch]=0
+                self.updates+=1
+                if ADAPTIVE:
+                    # unfiltered so a hand arriving speeds up the reading
+                    # which confirms it
+                    self.adaptBudget(ch,self.calibration.level(ch,raw),now)
+        except Exception:
+            # keep the last reading
+            self.fault(ch,now)
+            return False
+        self.due[ch]=(now+self.budget_ms[ch])&TICKS_MASK
+        return True
+
+    def schedule(self,k):
+        # put key k back in the due order
+        order=self.order
+        due=self.due[k]
+        lo=0
+        hi=len(order)
+        while lo<hi:
+            mid=(lo+hi)//2
+            if ticks_diff(self.due[order[mid]],due)<=0:
+                lo=mid+1
+            else:
+                hi=mid
+        order.insert(lo,k)
+
+    def poll(self):
+        # read the sensors whose measurement is due, earliest first
+        # the keys not yet due are never looked at so the cost depends
+        # on how many sensors are ready, not the number of keys
+        # at most MAX_READS are read, the rest are next in line
+        # returns the number of channels updated
+        if self.replay is not None and self.replay.started is None:
+            self.replay.start() # the recording plays from here
+        now=self.ticks()
+        order=self.order
+        updated=0
+        for i in range(min(MAX_READS,self.numKeys)):
+            k=order[0]
+            if ticks_diff(now,self.due[k])<0:
+                break
+            # starting a sensor takes a while, only one per poll
+            starting=self.tsl[k] is None or self.errors[k]>=FAIL_LIMIT
+            if self.metrics:
+                start=self.metrics.now()
+                ready=self.readChannel(k,now)
+                self.metrics.read(k,self.metrics.now()-start,ready)
+            else:
+                ready=self.readChannel(k,now)
+            if ready:
+                updated+=1
+            order.pop(0)
+            self.schedule(k)
+            if starting:
+                break
+        return updated
+
+    def getAllLevels(self,levels=None):
+        # return a list of the latest normalised readings
+        # only sensors with a measurement due are read so this
+        # does not block on the whole bus
+        # pass levels (e.g. an array of getNumKeys() floats) to have it
+        # filled in place instead of allocating a new list each call
+        self.poll()
+        if self.levelsAt!=self.updates:
+            self.levelsAt=self.updates
+            for k in range(self.numKeys):
+                self.levels[k]=self.cache[k]
+            if self.crosstalk:
+                self.crosstalk.apply(self.levels)
+        if levels is None:
+            return list(self.levels)
+        for k in range(self.numKeys):
+            levels[k]=self.levels[k]
         return levels
 
     def reset(self):
-        import time
+        if self.reset_pin is None:
+            return # replaying
         print("Keyboard resetting")
         self.reset_pin.value=0
         time.sleep(0.001) # 500ns is all that's needed
         self.reset_pin.value=1
+        self.bus.channel=None # the reset deselects every channel
         time.sleep(0.1)
     
     def getNumKeys(self):
-        return NUM_KEYS
+        return self.numKeys
             
     def dumpRanges(self):
-        print("Min",self.minLevel)
-        print("Max",self.maxLevel)
+        print("Min",list(self.minLevel))
+        print("Max",list(self.maxLevel))
+        print("Outliers",self.filter.outliers)
+        if self.crosstalk:
+            print("Crosstalk",list(self.crosstalk.weights),"suppressed",self.crosstalk.suppressed)
         
 if __name__=="__main__":
     
     # SDA,SCL,RST
     kbd=Keyboard(board.GP2,board.GP3,board.GP4)
-    import time
     
     print("Scanning channels/keys")
     #kbd.scanChannels()
@@ -141,4 +523,5 @@ if __name__=="__main__":
             
     except Exception as e:
         print("EXCEPTION ",e)
+        print("mux switches",kbd.bus.switches,"restarts",kbd.restarts,"faults",kbd.faults)
         kbd.dumpRanges()
\ No newline at end of file
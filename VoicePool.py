@@ -0,0 +1,141 @@
+'''
+VoicePool
+
+Shares a few mixer voices between the keys.
+
+The mixer sums every voice that is playing, even at level 0, so leaving a
+note looping on a voice per key costs as much with 56 silent keys as with 56
+sounding ones. Here a key only gets a voice when its level rises above
+THRESHOLD of full_scale, the level of a fully touched key. When the level
+drops back the voice fades out by FADE_STEP of full_scale per update() and
+is stopped. If every voice is busy a fading voice is taken
+first, then the quietest sounding one.
+
+    pool=VoicePool.VoicePool(mixer,keyboard.getNumKeys(),POLYPHONY,full_scale=0.1)
+    pool.setSamples(octaveNotes)
+    ...
+    for k in range(keyboard.getNumKeys()):
+        pool.setLevel(k,level)
+    pool.update()
+
+'''
+import array
+
+POLYPHONY=4       # mixer voices shared by the keys
+THRESHOLD=0.02    # fraction of full scale a key must reach to get a voice
+FADE_STEP=0.05    # fraction of full scale a released voice drops per update()
+
+FREE=-1
+
+
+class VoicePool():
+    def __init__(self,mixer,numKeys,voices=POLYPHONY,first=0,
+                 threshold=THRESHOLD,fade=FADE_STEP,full_scale=1.0):
+        # uses mixer voices first .. first+voices-1
+        # full_scale is the loudest level the keys are set to
+        self.mixer=mixer
+        self.voices=voices
+        self.first=first
+        self.threshold=threshold*full_scale
+        self.fade=fade*full_scale
+        self.samples=[None]*numKeys
+        self.owner=array.array("b",[FREE]*voices)   # key using each voice
+        self.fading=bytearray(voices)                # 1 while fading out
+        self.voiceOf=array.array("b",[FREE]*numKeys) # voice of each key
+        self.steals=0 # voices taken from sounding keys, for diagnostics
+
+    def setSamples(self,samples):
+        # the sample each key plays, e.g. after changing octave
+        # keys already sounding switch straight away at the same level
+        for k in range(len(samples)):
+            self.samples[k]=samples[k]
+        for v in range(self.voices):
+            k=self.owner[v]
+            if k!=FREE:
+                voice=self.mixer.voice[self.first+v]
+                level=voice.level
+                voice.play(self.samples[k],loop=True)
+                voice.level=level
+
+    def level(self,k):
+        # the level key k is sounding at
+        v=self.voiceOf[k]
+        if v==FREE:
+            return 0.0
+        return self.mixer.voice[self.first+v].level
+
+    def allocate(self,k):
+        # find a voice for key k, returns the voice number
+        best=FREE
+        for v in range(self.voices):
+            if self.owner[v]==k and self.fading[v]:
+                # still fading out from this key, take it back
+                self.fading[v]=0
+                self.voiceOf[k]=v
+                return v
+            if self.owner[v]==FREE:
+                best=v
+        if best==FREE:
+            best=self.steal()
+        voice=self.mixer.voice[self.first+best]
+        voice.play(self.samples[k],loop=True)
+        self.owner[best]=k
+        self.fading[best]=0
+        self.voiceOf[k]=best
+        return best
+
+    def steal(self):
+        # the quietest voice, preferring one already fading out
+        best=FREE
+        quietest=2.0
+        for v in range(self.voices):
+            level=self.mixer.voice[self.first+v].level
+            if not self.fading[v]:
+                level+=1.0 # sounding voices only if nothing is fading
+            if level<quietest:
+                best,quietest=v,level
+        k=self.owner[best]
+        if not self.fading[best]:
+            self.steals+=1
+        if self.voiceOf[k]==best:
+            self.voiceOf[k]=FREE
+        return best
+
+    def setLevel(self,k,level):
+        # set the level of key k, giving it a voice if it needs one
+        v=self.voiceOf[k]
+        if v==FREE:
+            if level<self.threshold:
+                return
+            v=self.allocate(k)
+        elif level<self.threshold:
+            # let it fade out from where it is
+            self.fading[v]=1
+            self.voiceOf[k]=FREE
+            return
+        self.mixer.voice[self.first+v].level=level
+
+    def update(self):
+        # fade out the released voices, stopping them when silent
+        for v in range(self.voices):
+            if self.fading[v]:
+                voice=self.mixer.voice[self.first+v]
+                level=voice.level-self.fade
+                if level<=0:
+                    voice.level=0
+                    voice.stop()
+                    self.fading[v]=0
+                    self.owner[v]=FREE
+                else:
+                    voice.level=level
+
+    def silence(self):
+        # stop every voice now
+        for v in range(self.voices):
+            voice=self.mixer.voice[self.first+v]
+            voice.level=0
+            voice.stop()
+            self.fading[v]=0
+            self.owner[v]=FREE
+        for k in range(len(self.voiceOf)):
+            self.voiceOf[k]=FREE
@@ -0,0 +1,197 @@
+'''
+Wavetables
+
+A shared bank of looped note tables for the mixer players.
+
+A single cycle of int(sample_rate/freq) samples truncates the period so the
+note plays sharp, A3 at 8kHz has a period of 36.36 samples but plays 36.
+Instead each table holds as many whole cycles as needed for its length to
+best match the true period, e.g. 11 cycles of A3 in 400 samples.
+
+The master cycle of each waveform is built by additive synthesis, one
+vectorised pass per partial into a single MASTER_SIZE buffer, then peak
+normalised. Note tables are interpolated from the master in one pass as well,
+ulab.numpy on the Pico and numpy on a PC, and cached so changing octave back
+and forth costs nothing.
+
+    bank=Wavetables.bank
+    bank.addWaveform("harmonics",Wavetables.harmonicPartials([1,2]))
+    table=bank.table(220.0,"harmonics",sample_rate=8000)
+    sample=audiocore.RawSample(table,sample_rate=8000)
+
+'''
+try:
+    import ulab.numpy as np
+except ImportError:
+    import numpy as np
+
+MASTER_SIZE=256   # samples in a master cycle, power of 2
+MAX_LENGTH=1024   # samples, the longest note table
+MAX_CYCLES=32     # most cycles to put in a table
+TOLERANCE=0.0003  # relative period error to stop searching, about 0.5 cent
+FULL_SCALE=2**15-1
+TABLE_BUDGET=48*1024 # bytes of note tables Octaves.buildNext() may use
+
+
+# semitones from each natural note to the next, starting on A
+NATURAL_STEPS=(2,1,2,2,1,2,2)
+
+
+def naturalNotes(count,first=21):
+    # midi notes of count natural (white) keys starting at A0 (21)
+    # e.g. 8 keys gives A0 B0 C1 D1 E1 F1 G1 A1
+    notes=[]
+    note=first
+    for i in range(count):
+        notes.append(note)
+        note+=NATURAL_STEPS[i%len(NATURAL_STEPS)]
+    return notes
+
+
+def bestLength(freq,sample_rate,max_length=MAX_LENGTH):
+    # return (cycles,length) so that length/cycles is as close as
+    # possible to the true period sample_rate/freq
+    period=sample_rate/freq
+    best_cycles=1
+    best_length=max(1,round(period))
+    best_error=abs(best_length-period)/period
+    for cycles in range(2,MAX_CYCLES+1):
+        if best_error<TOLERANCE:
+            break
+        length=round(period*cycles)
+        if length>max_length:
+            break
+        error=abs(length/cycles-period)/period
+        if error<best_error:
+            best_cycles,best_length,best_error=cycles,length,error
+    return best_cycles,best_length
+
+
+def harmonicPartials(harmonics,weights=None):
+    # partials for the base frequency plus harmonics
+    # harmonic h is (h+1) times the base frequency, as in HarmonicPlayer
+    # weights are per harmonic relative to the base, default 1/(h+1)
+    partials=[(1,1.0)]
+    for i in range(len(harmonics)):
+        h=harmonics[i]
+        if weights is None:
+            w=1/(h+1)
+        else:
+            w=weights[i]
+        partials.append((h+1,w))
+    return partials
+
+
+class WavetableBank():
+    def __init__(self,max_length=MAX_LENGTH):
+        self.max_length=max_length
+        self.waveforms={"sine":[(1,1.0)]} # name -> [(multiple,weight),..]
+        self.masters={}  # name -> one cycle array
+        self.tables={}   # (name,sample_rate,freq,vol) -> note table
+
+    def addWaveform(self,name,partials):
+        # partials is a list of (multiple of base frequency,amplitude weight)
+        # replacing a waveform drops its cached tables
+        self.waveforms[name]=partials
+        self.forget(name)
+
+    def forget(self,name=None):
+        # drop cached tables, for one waveform or all of them
+        if name is None:
+            self.masters={}
+            self.tables={}
+            return
+        self.masters.pop(name,None)
+        for key in [k for k in self.tables if k[0]==name]:
+            del self.tables[key]
+
+    def master(self,name):
+        # one cycle of the waveform, MASTER_SIZE samples peak normalised
+        # to FULL_SCALE, each partial is added in one vectorised step
+        wave=self.masters.get(name)
+        if wave is None:
+            x=np.linspace(0,2*np.pi,MASTER_SIZE,endpoint=False)
+            mix=np.zeros(MASTER_SIZE)
+            for m,w in self.waveforms[name]:
+                mix+=w*np.sin(m*x)
+            peak=np.max(abs(mix))
+            if peak>0:
+                mix*=FULL_SCALE/peak
+            # repeat the first sample at the end for interpolation
+            wave=np.zeros(MASTER_SIZE+1)
+            wave[:MASTER_SIZE]=mix
+            wave[MASTER_SIZE]=mix[0]
+            self.masters[name]=wave
+        return wave
+
+    def table(self,freq,name="sine",sample_rate=8000,vol=1.0):
+        # a looped note table for freq, cached
+        key=(name,sample_rate,round(freq,3),vol)
+        table=self.tables.get(key)
+        if table is None:
+            cycles,length=bestLength(freq,sample_rate,self.max_length)
+            table=self.render(self.master(name),cycles,length,vol)
+            self.tables[key]=table
+        return table
+
+    @staticmethod
+    def render(wave,cycles,length,vol):
+        # interpolate cycles of wave into length int16 samples
+        # the phase wraps so the table ends exactly on a cycle
+        phase=np.arange(length)*(cycles*MASTER_SIZE/length)
+        phase=phase-np.floor(phase/MASTER_SIZE)*MASTER_SIZE
+        xp=np.arange(MASTER_SIZE+1)
+        return np.array(np.interp(phase,xp,wave)*vol,dtype=np.int16)
+
+    def size(self):
+        # bytes held in note tables
+        return sum(2*t.size for t in self.tables.values())
+
+
+# one bank shared by everything that makes tones
+bank=WavetableBank()
+
+
+class Octaves():
+    # the note samples for every key, per octave
+    # built on first use, or a note at a time by buildNext() after
+    # background(), so changing octave while playing is just a lookup
+    # with nothing to allocate
+    def __init__(self,makeNote,baseNotes,budget=TABLE_BUDGET):
+        # makeNote(midiNote) returns a sample for the mixer
+        self.makeNote=makeNote
+        self.baseNotes=baseNotes
+        self.budget=budget
+        self.samples={} # octave -> [sample per key]
+        self.queue=[]   # octaves waiting for buildNext()
+        self.partial=[] # notes of queue[0] built so far
+
+    def get(self,octave):
+        notes=self.samples.get(octave)
+        if notes is None:
+            notes=[self.makeNote(n+12*octave) for n in self.baseNotes]
+            self.samples[octave]=notes
+        return notes
+
+    def background(self,octaves):
+        # queue octaves to be built a note at a time by buildNext()
+        self.queue=[octave for octave in octaves if octave not in self.samples]
+        self.partial=[]
+
+    def buildNext(self):
+        # build one note of the queued octaves, call between passes of
+        # the control loop, returns False once there is nothing left
+        if not self.queue:
+            return False
+        octave=self.queue[0]
+        if octave in self.samples or bank.size()>=self.budget:
+            # built by get() meanwhile, or no room
+            self.queue.pop(0)
+            self.partial=[]
+            return len(self.queue)>0
+        self.partial.append(self.makeNote(self.baseNotes[len(self.partial)]+12*octave))
+        if len(self.partial)==len(self.baseNotes):
+            self.samples[octave]=self.partial
+            self.partial=[]
+            self.queue.pop(0)
+        return True
@@ -0,0 +1,40 @@
+'''
+hostsim
+
+CPython stand-ins for the CircuitPython modules used by the players so they
+can be run, and benchmarked, on a PC before flashing a board.
+
+    import hostsim
+    hostsim.install()   # fake board, busio, audiomixer, synthio etc.
+    import Engine
+    Engine.AUTORUN=False # otherwise importing a player runs it
+    import Player       # constructs simulated hardware
+
+The simulated sensors, mux and I2C bus live in hostsim.world. Run the
+benchmarks with
+
+    python -m hostsim.bench
+
+from the top of the repo (the players open Music/*.wav relative to it).
+'''
+import os
+import sys
+import gc
+
+from hostsim import world
+
+DEVICES=os.path.join(os.path.dirname(__file__),"devices")
+
+HEAP_SIZE=512*1024 # pretend heap reported by gc.mem_free()
+
+
+def install():
+    # put the fake device modules ahead of anything else on the path
+    if DEVICES not in sys.path:
+        sys.path.insert(0,DEVICES)
+
+    # CircuitPython's gc has mem_free/mem_alloc, CPython's does not
+    if not hasattr(gc,"mem_free"):
+        gc.mem_free=lambda: HEAP_SIZE
+        gc.mem_alloc=lambda: 0
+    return world.reset()
@@ -0,0 +1,189 @@
+'''
+bench
+
+Control loop benchmarks for the players on simulated hardware.
+
+    python -m hostsim.bench                 # all players
+    python -m hostsim.bench Player MixPlayer
+    python -m hostsim.bench --muxes 7 Player  # 56 keys
+    python -m hostsim.bench --replay trace.vlt --speed 4  # a recorded session
+    python -m hostsim.bench --acquisition thread  # sensors polled on a thread
+
+For each player this reports
+    loop/s    iterations of the control loop per second
+    latency   ms from a key being pressed until the player responds (mean/max),
+              loops started by a Transport wait for the next bar, up to
+              LATENCY_TIMEOUT, one shot hits from the strike
+    alloc     bytes allocated per loop iteration (peak, via tracemalloc)
+    i2c       I2C transactions and mux writes per second
+
+With --acquisition thread the sensors are polled on a second thread, as on
+the Pico's second core, and the snapshots the control loop had to copy
+again because the poller published under it are reported as retries.
+CPython hands the interpreter between the threads every
+sys.getswitchinterval(), 5ms, which shows in the latency.
+
+With --replay the keyboard plays a TraceRecorder recording instead of the
+simulated sensors and the loop rate and readings over the whole recording
+are reported.
+'''
+import sys
+import io
+import time
+import importlib
+import tracemalloc
+import contextlib
+
+import hostsim
+from hostsim import world
+
+NEAR=20  # mm, a finger on the key
+RUN_TIME=1.0 # s per measurement
+LATENCY_TIMEOUT=1.0 # s
+
+
+def sounding(mod,k):
+    # is key k of the player sounding
+    return mod.engine.source.level(k)>0.05
+
+
+PLAYERS=["Player","HarmonicPlayer","LoopPlayer","MixPlayer","MidiMixPlayer"]
+
+
+class Null(io.TextIOBase):
+    # swallows the players' prints without allocating a buffer
+    def write(self,s):
+        return len(s)
+
+
+def load(name,muxes=1,replay=None,acquisition=None):
+    # import a fresh copy of the player on fresh simulated hardware
+    # with muxes full TCA9548A (8 keys each)
+    # or replaying a recording, (path,speed)
+    # acquisition overrides the player's, see Acquisition
+    hostsim.install()
+    for mod in (name,"Engine","VL53_Keyboard","TraceRecorder"):
+        sys.modules.pop(mod,None)
+    keyboard=importlib.import_module("VL53_Keyboard")
+    engine=importlib.import_module("Engine")
+    engine.AUTORUN=False # build the player, step() is driven from here
+    if acquisition:
+        engine.DEFAULTS["acquisition"]=acquisition
+    keyboard.TOPOLOGY=[(0x70+m,range(8)) for m in range(muxes)]
+    if replay:
+        path,speed=replay
+        recorder=importlib.import_module("TraceRecorder")
+        keyboard.REPLAY=recorder.Replay(*recorder.read(path),speed=speed)
+    with contextlib.redirect_stdout(Null()):
+        return importlib.import_module(name)
+
+
+def calibrate(mod,step,keys):
+    # sweep every key near and far so normalise() learns the range
+    for dist in (NEAR,world.FAR):
+        for k in range(keys):
+            world.current.setDistance(k,dist)
+        end=time.monotonic()+0.1
+        while time.monotonic()<end:
+            step()
+
+
+def loopRate(step):
+    bus=world.current.bus
+    count=0
+    transactions=bus.transactions
+    switches=bus.mux_writes
+    end=time.monotonic()+RUN_TIME
+    while time.monotonic()<end:
+        step()
+        count+=1
+    return (count/RUN_TIME,
+            (bus.transactions-transactions)/RUN_TIME,
+            (bus.mux_writes-switches)/RUN_TIME)
+
+
+def settle(mod):
+    # the fake mixer only plays on when rendered, which the benchmarks
+    # don't do, so end any one shot hits as they would have by now
+    for voice in mod.engine.mixer.voice:
+        if voice.playing and not voice.loop:
+            voice.stop()
+
+
+def latency(mod,step,sounding,keys):
+    # press each key in turn and time until the player responds
+    results=[]
+    for k in range(keys):
+        settle(mod)
+        world.current.setDistance(k,NEAR)
+        start=time.monotonic()
+        while not sounding(mod,k) and time.monotonic()-start<LATENCY_TIMEOUT:
+            step()
+        results.append(time.monotonic()-start)
+        world.current.setDistance(k,world.FAR)
+        end=time.monotonic()+0.1
+        while time.monotonic()<end:
+            step()
+    return sum(results)/len(results)*1000,max(results)*1000
+
+
+def allocation(step,iterations=200):
+    tracemalloc.start()
+    total=0
+    for i in range(iterations):
+        tracemalloc.reset_peak()
+        base=tracemalloc.get_traced_memory()[0]
+        step()
+        total+=tracemalloc.get_traced_memory()[1]-base
+    tracemalloc.stop()
+    return total/iterations
+
+
+def bench(name,muxes=1,acquisition=None):
+    mod=load(name,muxes,acquisition=acquisition)
+    step=mod.engine.step
+    keys=mod.engine.numKeys
+    with contextlib.redirect_stdout(Null()):
+        calibrate(mod,step,keys)
+        rate,transactions,switches=loopRate(step)
+        mean,worst=latency(mod,step,sounding,keys)
+        alloc=allocation(step)
+    mod.engine.acquisition.stop()
+    retries=""
+    if mod.engine.acquisition.mode!="inline":
+        retries=f"  retries {mod.engine.acquisition.snapshot.retries}"
+    print(f"{name:16} keys {keys:2}  loop/s {rate:8.0f}  latency {mean:6.1f}/{worst:6.1f} ms"
+          f"  alloc {alloc:6.0f} B  i2c/s {transactions:5.0f} mux/s {switches:5.0f}{retries}")
+
+
+def benchReplay(name,path,speed=1.0):
+    mod=load(name,replay=(path,speed))
+    step=mod.engine.step
+    keyboard=mod.engine.keyboard
+    count=0
+    with contextlib.redirect_stdout(Null()):
+        start=time.monotonic()
+        while not keyboard.replay.finished():
+            step()
+            count+=1
+        seconds=time.monotonic()-start
+        alloc=allocation(step)
+    print(f"{name:16} keys {keyboard.getNumKeys():2}  loop/s {count/seconds:8.0f}"
+          f"  replay {seconds:6.1f} s x{speed:g}  readings {keyboard.updates:6}"
+          f"  outliers {keyboard.filter.outliers:4}  alloc {alloc:6.0f} B")
+
+
+if __name__=="__main__":
+    import argparse
+    parser=argparse.ArgumentParser(description="Benchmark the players on simulated hardware")
+    parser.add_argument("players",nargs="*",default=PLAYERS)
+    parser.add_argument("--muxes",type=int,default=1,help="TCA9548A muxes, 8 keys each")
+    parser.add_argument("--replay",help="play a TraceRecorder recording instead")
+    parser.add_argument("--speed",type=float,default=1.0,help="replay speed, 2 is twice as fast")
+    parser.add_argument("--acquisition",choices=["inline","thread"],help="override the players' acquisition")
+    args=parser.parse_args()
+    for name in args.players:
+        if args.replay:
+            benchReplay(name,args.replay,args.speed)
+        else:
+            bench(name,args.muxes,args.acquisition)
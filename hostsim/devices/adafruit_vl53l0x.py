@@ -0,0 +1,99 @@
+'''
+adafruit_vl53l0x
+
+A VL53L0X in continuous mode completes a measurement every timing budget.
+data_ready is True once one has completed since the last read and distance
+returns the world distance for the sensor at that moment. Both go through
+the I2C channel so mux traffic is counted as on the real device.
+'''
+import time
+
+from hostsim import world
+
+_REG=bytearray(1)
+_BUF=bytearray(2)
+
+
+class VL53L0X():
+    def __init__(self,i2c,address=world.SENSOR_ADDRESS,io_timeout_s=0):
+        self.i2c=i2c
+        self.address=address
+        self.io_timeout_s=io_timeout_s
+        self.signal_rate_limit=0.25
+        self._budget=33000
+        self._continuous_mode=False
+        self._started=0.0
+        self._last=0.0
+        # find out which sensor the channel reaches
+        self.where=self._transfer()
+
+    def _transfer(self):
+        self.i2c.try_lock()
+        try:
+            self.i2c.writeto_then_readfrom(self.address,_REG,_BUF)
+            return world.current.bus.route(self.address)
+        finally:
+            self.i2c.unlock()
+
+    def _completed(self):
+        # time the most recent measurement completed
+        period=self._budget/1000000
+        now=time.monotonic()
+        return self._started+int((now-self._started)/period)*period
+
+    @property
+    def measurement_timing_budget(self):
+        return self._budget
+
+    @measurement_timing_budget.setter
+    def measurement_timing_budget(self,budget_us):
+        if budget_us<20000:
+            raise ValueError("budget must be >= 20000us")
+        self._budget=budget_us
+
+    def start_continuous(self):
+        self._transfer()
+        self._continuous_mode=True
+        self._started=time.monotonic()
+        self._last=self._started
+
+    def stop_continuous(self):
+        self._transfer()
+        self._continuous_mode=False
+
+    def continuous_mode(self):
+        return self
+
+    def __enter__(self):
+        self.start_continuous()
+        return self
+
+    def __exit__(self,*exc):
+        self.stop_continuous()
+
+    @property
+    def data_ready(self):
+        self._transfer()
+        if not self._continuous_mode:
+            return True
+        return self._completed()>self._last
+
+    def do_range_measurement(self):
+        self._transfer()
+
+    def read_range(self):
+        # like the driver this waits for a measurement if none is ready
+        if self._continuous_mode:
+            while self._completed()<=self._last:
+                pass
+        where=self._transfer()
+        self._last=self._completed()
+        return int(world.current.distance(where))
+
+    @property
+    def range(self):
+        return self.read_range()
+
+    @property
+    def distance(self):
+        return self.range/10
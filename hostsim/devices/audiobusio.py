@@ -0,0 +1,30 @@
+'''
+audiobusio
+
+I2SOut just remembers what it is playing, nothing is clocked out.
+'''
+
+
+class I2SOut():
+    def __init__(self,bit_clock,word_select,data,*,main_clock=None,left_justified=False):
+        self.sample=None
+        self.paused=False
+
+    @property
+    def playing(self):
+        return self.sample is not None
+
+    def play(self,sample,*,loop=False):
+        self.sample=sample
+
+    def stop(self):
+        self.sample=None
+
+    def pause(self):
+        self.paused=True
+
+    def resume(self):
+        self.paused=False
+
+    def deinit(self):
+        self.sample=None
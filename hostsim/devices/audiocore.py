@@ -0,0 +1,59 @@
+'''
+audiocore
+
+Samples hold their data as a numpy int16 array, one column per channel, so
+the fake mixer can render them.
+'''
+import wave
+
+import numpy as np
+
+MIN_BUFFER=8     # bytes, the WaveFile buffer sizes CircuitPython accepts
+MAX_BUFFER=1024
+
+class RawSample():
+    def __init__(self,buffer,*,channel_count=1,sample_rate=8000,single_buffer=True):
+        data=np.asarray(buffer)
+        if data.dtype==np.uint8:
+            data=(data.astype(np.int16)-128)<<8
+        elif data.dtype==np.int8:
+            data=data.astype(np.int16)<<8
+        elif data.dtype==np.uint16:
+            data=(data.astype(np.int32)-32768).astype(np.int16)
+        self.data=data.astype(np.int16).reshape(-1,channel_count)
+        self.buffer=buffer
+        self.channel_count=channel_count
+        self.sample_rate=sample_rate
+        self.bits_per_sample=16
+
+    def deinit(self):
+        pass
+
+
+class WaveFile():
+    def __init__(self,file,buffer=None):
+        if isinstance(file,str):
+            file=open(file,"rb")
+        if buffer is not None and not MIN_BUFFER<=len(memoryview(buffer).cast("B"))<=MAX_BUFFER:
+            raise ValueError(f"Buffer must be {MIN_BUFFER} to {MAX_BUFFER} bytes")
+        self.file=file
+        self.buffer=buffer
+        with wave.open(file,"rb") as w:
+            self.channel_count=w.getnchannels()
+            self.sample_rate=w.getframerate()
+            self.bits_per_sample=w.getsampwidth()*8
+            frames=w.readframes(w.getnframes())
+        if self.bits_per_sample==8:
+            data=(np.frombuffer(frames,dtype=np.uint8).astype(np.int16)-128)<<8
+        else:
+            data=np.frombuffer(frames,dtype=np.int16)
+        self.data=data.reshape(-1,self.channel_count)
+
+    def deinit(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.deinit()
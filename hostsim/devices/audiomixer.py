@@ -0,0 +1,81 @@
+'''
+audiomixer
+
+render(n) mixes n frames of every playing voice into a numpy int16 buffer,
+summing every voice as the real mixer does even when its level is 0.
+'''
+import numpy as np
+
+
+class MixerVoice():
+    def __init__(self,mixer):
+        self.mixer=mixer
+        self.sample=None
+        self.loop=False
+        self.level=1.0
+        self.position=0
+
+    @property
+    def playing(self):
+        return self.sample is not None
+
+    def play(self,sample,*,loop=False):
+        self.sample=sample
+        self.loop=loop
+        self.position=0
+
+    def stop(self):
+        self.sample=None
+
+    def render(self,frames):
+        # frames of this voice at its level, float
+        out=np.zeros((frames,self.mixer.channel_count))
+        if self.sample is None:
+            return out
+        if hasattr(self.sample,"render"):
+            out+=self.sample.render(frames).reshape(frames,-1)
+        else:
+            data=self.sample.data
+            done=0
+            while done<frames and self.sample is not None:
+                take=min(frames-done,len(data)-self.position)
+                out[done:done+take]+=data[self.position:self.position+take]
+                done+=take
+                self.position+=take
+                if self.position>=len(data):
+                    self.position=0
+                    if not self.loop:
+                        self.sample=None
+        return out*self.level
+
+
+class Mixer():
+    def __init__(self,voice_count=2,buffer_size=1024,channel_count=2,
+                 bits_per_sample=16,samples_signed=True,sample_rate=8000):
+        self.voice=tuple(MixerVoice(self) for v in range(voice_count))
+        self.buffer_size=buffer_size
+        self.channel_count=channel_count
+        self.bits_per_sample=bits_per_sample
+        self.samples_signed=samples_signed
+        self.sample_rate=sample_rate
+        self.frames=0 # frames rendered so far
+
+    @property
+    def playing(self):
+        return any(v.playing for v in self.voice)
+
+    def play(self,sample,*,voice=0,loop=False):
+        self.voice[voice].play(sample,loop=loop)
+
+    def stop_voice(self,voice=0):
+        self.voice[voice].stop()
+
+    def render(self,frames):
+        out=np.zeros((frames,self.channel_count))
+        for v in self.voice:
+            out+=v.render(frames)
+        self.frames+=frames
+        return np.clip(out,-32768,32767).astype(np.int16)
+
+    def deinit(self):
+        pass
@@ -0,0 +1,19 @@
+'''
+board
+
+Pico pin names.
+'''
+
+
+class Pin():
+    def __init__(self,name):
+        self.name=name
+
+    def __repr__(self):
+        return "board."+self.name
+
+
+for _n in range(29):
+    globals()["GP%d"%_n]=Pin("GP%d"%_n)
+
+LED=Pin("LED")
@@ -0,0 +1,51 @@
+'''
+busio
+
+I2C on the simulated bus. Every transaction takes world.TRANSACTION_BITS
+clocks at the bus frequency so the benchmarks see the price of bus traffic.
+'''
+from hostsim import world
+
+
+class I2C():
+    def __init__(self,scl,sda,frequency=100000,timeout=255):
+        self.bus=world.current.bus
+        self.bus.delay=world.TRANSACTION_BITS/frequency
+        self.locked=False
+
+    def try_lock(self):
+        if self.locked:
+            return False
+        self.locked=True
+        return True
+
+    def unlock(self):
+        self.locked=False
+
+    def scan(self):
+        found=list(self.bus.muxes)
+        try:
+            self.bus.route(world.SENSOR_ADDRESS)
+            found.append(world.SENSOR_ADDRESS)
+        except OSError:
+            pass
+        return found
+
+    def writeto(self,address,buffer,*,start=0,end=None):
+        self.bus.transfer(address,buffer[start:end])
+
+    def readfrom_into(self,address,buffer,*,start=0,end=None):
+        self.bus.transfer(address)
+
+    def writeto_then_readfrom(self,address,out_buffer,in_buffer,*,
+                              out_start=0,out_end=None,in_start=0,in_end=None):
+        self.bus.transfer(address,out_buffer[out_start:out_end])
+
+    def deinit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.deinit()
@@ -0,0 +1,51 @@
+'''
+digitalio
+
+Pins just hold their value. Driving the mux reset pin low deselects all the
+mux channels, as the real TCA9548A does.
+'''
+from hostsim import world
+
+
+class Direction():
+    INPUT="INPUT"
+    OUTPUT="OUTPUT"
+
+
+class Pull():
+    UP="UP"
+    DOWN="DOWN"
+
+
+class DriveMode():
+    PUSH_PULL="PUSH_PULL"
+    OPEN_DRAIN="OPEN_DRAIN"
+
+
+class DigitalInOut():
+    def __init__(self,pin):
+        self.pin=pin
+        self.direction=Direction.INPUT
+        self.pull=None
+        self._value=False
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self,v):
+        self._value=bool(v)
+        if not self._value:
+            world.current.bus.resetMuxes()
+
+    def switch_to_output(self,value=False,drive_mode=DriveMode.PUSH_PULL):
+        self.direction=Direction.OUTPUT
+        self.value=value
+
+    def switch_to_input(self,pull=None):
+        self.direction=Direction.INPUT
+        self.pull=pull
+
+    def deinit(self):
+        pass
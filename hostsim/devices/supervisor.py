@@ -0,0 +1,16 @@
+'''
+supervisor
+
+ticks_ms() as on CircuitPython, wrapping at 2**29.
+'''
+import time
+
+_start=time.monotonic_ns()
+
+
+def ticks_ms():
+    return ((time.monotonic_ns()-_start)//1000000)&((1<<29)-1)
+
+
+def reload():
+    pass
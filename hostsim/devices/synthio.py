@@ -0,0 +1,175 @@
+'''
+synthio
+
+Enough of synthio for the players. Notes are rendered from their waveform
+(a sine if none) at their amplitude with a linear attack/release envelope.
+'''
+import math
+import time
+
+import numpy as np
+
+
+def midi_to_hz(midi_note):
+    return 440*2**((midi_note-69)/12)
+
+
+def voct_to_hz(ctrl):
+    return midi_to_hz(12*(ctrl+5.25))
+
+
+class Envelope():
+    def __init__(self,*,attack_time=0.1,decay_time=0.05,release_time=0.2,
+                 attack_level=1.0,sustain_level=0.8):
+        self.attack_time=attack_time
+        self.decay_time=decay_time
+        self.release_time=release_time
+        self.attack_level=attack_level
+        self.sustain_level=sustain_level
+
+
+class LFO():
+    # a sine, its value taken from the wall clock when a block is rendered
+    def __init__(self,waveform=None,*,rate=1.0,scale=1.0,offset=0.0,
+                 phase_offset=0.0,once=False,interpolate=True):
+        self.waveform=waveform
+        self.rate=rate
+        self.scale=scale
+        self.offset=offset
+        self.phase_offset=phase_offset
+        self.once=once
+        self.interpolate=interpolate
+
+    @property
+    def value(self):
+        phase=self.rate*time.monotonic()+self.phase_offset
+        return self.offset+self.scale*math.sin(2*math.pi*phase)
+
+
+def _block(value):
+    # a BlockInput, a number or an LFO
+    return value.value if isinstance(value,LFO) else value
+
+
+class Note():
+    def __init__(self,frequency,*,panning=0.0,waveform=None,envelope=None,
+                 amplitude=1.0,bend=0.0,filter=None,ring_frequency=0.0,
+                 ring_bend=0.0,ring_waveform=None):
+        self.frequency=frequency
+        self.panning=panning
+        self.waveform=waveform
+        self.envelope=envelope
+        self.amplitude=amplitude
+        self.bend=bend
+        self.filter=filter
+        self.ring_frequency=ring_frequency
+        self.ring_bend=ring_bend
+        self.ring_waveform=ring_waveform
+
+
+class _Voice():
+    def __init__(self,note):
+        self.note=note
+        self.phase=0.0
+        self.env=0.0
+        self.releasing=False
+
+
+class Synthesizer():
+    def __init__(self,*,sample_rate=11025,channel_count=1,waveform=None,envelope=None):
+        self.sample_rate=sample_rate
+        self.channel_count=channel_count
+        self.waveform=waveform
+        self.envelope=envelope or Envelope()
+        self.voices={} # note -> _Voice
+        self.max_polyphony=12
+        self.presses=0
+        self.releases=0
+
+    def _note(self,n):
+        if isinstance(n,Note):
+            return n
+        return _MidiNote.get(n)
+
+    @staticmethod
+    def _iter(notes):
+        if isinstance(notes,(int,Note)):
+            return (notes,)
+        return notes
+
+    def press(self,press=()):
+        for n in self._iter(press):
+            note=self._note(n)
+            v=self.voices.get(note)
+            if v is None or v.releasing:
+                self.voices[note]=_Voice(note)
+            self.presses+=1
+
+    def release(self,release=()):
+        for n in self._iter(release):
+            v=self.voices.get(self._note(n))
+            if v is not None:
+                v.releasing=True
+            self.releases+=1
+
+    def release_then_press(self,release=(),press=()):
+        self.release(release)
+        self.press(press)
+
+    def release_all(self):
+        self.release(list(self.voices))
+
+    def release_all_then_press(self,press=()):
+        self.release_all()
+        self.press(press)
+
+    @property
+    def pressed(self):
+        return tuple(n for n,v in self.voices.items() if not v.releasing)
+
+    def note_info(self,note):
+        v=self.voices.get(self._note(note))
+        if v is None:
+            return (None,0.0)
+        return ("RELEASE" if v.releasing else "SUSTAIN",v.env)
+
+    def render(self,frames):
+        out=np.zeros(frames)
+        t=np.arange(frames)
+        for note,v in list(self.voices.items()):
+            env=note.envelope or self.envelope
+            freq=note.frequency*2**_block(note.bend)
+            phase=v.phase+t*freq/self.sample_rate
+            wave=note.waveform if note.waveform is not None else self.waveform
+            if wave is None:
+                tone=np.sin(2*np.pi*phase)*32767
+            else:
+                wave=np.asarray(wave)
+                tone=wave[(phase*len(wave)).astype(int)%len(wave)]
+            if v.releasing:
+                rate=1/max(env.release_time*self.sample_rate,1)
+                level=np.maximum(v.env-rate*(t+1),0)
+            else:
+                rate=1/max(env.attack_time*self.sample_rate,1)
+                level=np.minimum(v.env+rate*(t+1),env.sustain_level)
+            out+=tone*level*note.amplitude
+            v.phase=phase[-1]%1.0 if frames else v.phase
+            v.env=level[-1] if frames else v.env
+            if v.releasing and v.env<=0:
+                del self.voices[note]
+        return out
+
+    def deinit(self):
+        self.voices.clear()
+
+
+class _MidiNote():
+    # synthio turns pressed midi note numbers into notes, one per number
+    notes={}
+
+    @classmethod
+    def get(cls,n):
+        note=cls.notes.get(n)
+        if note is None:
+            note=cls.notes[n]=Note(midi_to_hz(n))
+        return note
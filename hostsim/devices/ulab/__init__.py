@@ -0,0 +1,5 @@
+'''
+ulab
+
+numpy stands in for ulab.numpy on the host.
+'''
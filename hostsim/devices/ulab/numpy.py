@@ -0,0 +1,6 @@
+'''
+ulab.numpy
+
+numpy stands in for ulab.numpy on the host.
+'''
+from numpy import *
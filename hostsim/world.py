@@ -0,0 +1,147 @@
+'''
+world
+
+The simulated hardware shared by the fake device modules: one I2C bus with
+TCA9548A muxes on it and a VL53L0X on each mux channel. Each sensor reads its
+distance from a Trace, either scripted or recorded, or a live value set by
+the benchmark.
+
+Keys are numbered in mux order, key n is on mux 0x70+n//8 channel n%8.
+'''
+import time
+
+FAR=819       # mm, roughly the furthest a VL53L0X reports
+SENSOR_ADDRESS=0x29
+TRANSACTION_BITS=40 # clocks in a typical transaction, address and a few bytes
+
+
+def key(n):
+    # (mux address, channel) for key number n
+    return (0x70+n//8,n%8)
+
+
+def busyWait(seconds):
+    # time.sleep() is far too coarse for sub-ms delays
+    end=time.perf_counter()+seconds
+    while time.perf_counter()<end:
+        pass
+
+
+class Trace():
+    # a distance trace, a list of (time s, distance mm) steps
+    # the distance holds until the next step
+    def __init__(self,points=None,loop=False):
+        self.points=points or [(0.0,FAR)]
+        self.loop=loop
+
+    def length(self):
+        return self.points[-1][0]
+
+    def value(self,t):
+        if self.loop and self.length()>0:
+            t=t%self.length()
+        mm=self.points[0][1]
+        for when,dist in self.points:
+            if when>t:
+                break
+            mm=dist
+        return mm
+
+    @staticmethod
+    def presses(times,near=20,hold=0.3,far=FAR):
+        # scripted trace pressing the key at each of times for hold seconds
+        points=[(0.0,far)]
+        for t in times:
+            points.append((t,near))
+            points.append((t+hold,far))
+        return Trace(points)
+
+
+class Bus():
+    # routing and statistics for the simulated I2C bus
+    def __init__(self):
+        self.muxes={}       # address -> channel mask
+        self.transactions=0
+        self.mux_writes=0
+        self.delay=TRANSACTION_BITS/100000 # s per transaction, set by busio.I2C
+        self.faults=set()   # (mux,channel) whose sensor doesn't respond
+
+    def addMux(self,address):
+        self.muxes.setdefault(address,0)
+
+    def route(self,address):
+        # return the (mux,channel) the address reaches, errors like a
+        # real bus if nothing or more than one device answers
+        found=[]
+        for mux,mask in self.muxes.items():
+            for ch in range(8):
+                if mask & (1<<ch):
+                    found.append((mux,ch))
+        if len(found)==0:
+            raise OSError(19,"No I2C device at address: "+hex(address))
+        if len(found)>1:
+            raise OSError(5,"I2C bus collision at address: "+hex(address))
+        if found[0] in self.faults:
+            raise OSError(5,"Input/output error")
+        return found[0]
+
+    def transfer(self,address,out=None):
+        # one I2C transaction, returns the (mux,channel) reached
+        self.transactions+=1
+        if self.delay:
+            busyWait(self.delay)
+        if address in self.muxes:
+            if out is not None and len(out)>0:
+                self.muxes[address]=out[0]
+                self.mux_writes+=1
+            return None
+        return self.route(address)
+
+    def resetMuxes(self):
+        for mux in self.muxes:
+            self.muxes[mux]=0
+
+
+class World():
+    def __init__(self):
+        self.bus=Bus()
+        self.traces={}  # (mux,channel) -> Trace
+        self.live={}    # (mux,channel) -> mm, overrides the trace
+        self.start=time.monotonic()
+
+    def now(self):
+        return time.monotonic()-self.start
+
+    def setTrace(self,n,trace):
+        self.traces[key(n)]=trace
+
+    def setDistance(self,n,mm):
+        # set a key distance now, used by the latency benchmark
+        self.live[key(n)]=mm
+
+    def clearDistance(self,n):
+        self.live.pop(key(n),None)
+
+    def setFault(self,n,fault=True):
+        # make key n's sensor fail every transaction, or recover
+        if fault:
+            self.bus.faults.add(key(n))
+        else:
+            self.bus.faults.discard(key(n))
+
+    def distance(self,where):
+        if where in self.live:
+            return self.live[where]
+        trace=self.traces.get(where)
+        if trace is None:
+            return FAR
+        return trace.value(self.now())
+
+
+current=World()
+
+
+def reset():
+    global current
+    current=World()
+    return current
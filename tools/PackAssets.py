@@ -0,0 +1,249 @@
+'''
+PackAssets
+
+Host side preparation of the Music/ files used by the players.
+
+The mixer rejects samples whose rate, channels or bits don't match its own,
+and a 44.1kHz loop in an 8kHz player wastes five times the flash and RAM.
+For each player this finds the hits, loops and sample rate in its CONFIG,
+then converts every file it uses to the mixer's 16 bit signed mono:
+
+    resample to the mixer rate (windowed sinc, low passed below the
+    lower of the two Nyquist frequencies so downsampling doesn't alias)
+    mix down to mono
+    normalise the peak
+    hits only, trim silence from the start and end, widened out to the
+    nearest zero crossings so the hit starts and stops without a click
+
+Loops are never cut, they keep their length so they stay in time with the
+bar. The hits go into one bundle per player, Music/<player>.pak, which
+OneShots.SampleCache loads with AssetBundle.py. The loops are streamed from
+their WAV files by StreamLoops, so they are only written as converted WAV
+files, when asked for with --wav-dir, for copying over the originals.
+
+    python tools/PackAssets.py                    # every player
+    python tools/PackAssets.py MixPlayer --wav-dir Music/packed
+
+Bundle format, little endian
+
+    b"PAK1" u16 count
+    count x (u8 name length, name, u32 sample rate, u8 channels, u8 bits,
+             u32 offset, u32 length)
+    sample data, offsets from the start of the file
+
+'''
+import os
+import sys
+import ast
+import math
+import wave
+import array
+import struct
+import argparse
+
+ROOT=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLAYERS=["Player","HarmonicPlayer","LoopPlayer","MixPlayer","MidiMixPlayer"]
+LOOP_NAMES=("LOOPS","BACKING_LOOPS")
+CONFIG_LOOPS=("loops","backing") # streamed by StreamLoops
+CONFIG_HITS=("hits",)            # held in RAM, from the bundle
+BITS=16                          # the mixers are 16 bit signed
+
+MAGIC=b"PAK1"
+SILENCE=0.01      # fraction of full scale treated as silence when trimming
+PEAK=0.95         # normalised peak
+MAX_SNAP=0.01     # s, furthest an end may move to find a zero crossing
+TAPS=8            # zero crossings of the resampling filter either side
+CUTOFF=0.9        # of the lower Nyquist, room for the filter to roll off
+
+
+def playerConfig(name):
+    # (hit files,loop files,mixer sample rate) for a player, read from its
+    # source, the players can't be imported here since they start the hardware
+    path=os.path.join(ROOT,name+".py")
+    tree=ast.parse(open(path).read(),path)
+    hits=[]
+    loops=[]
+    rate=None
+    for node in ast.walk(tree):
+        if isinstance(node,ast.Assign):
+            for target in node.targets:
+                if isinstance(target,ast.Name) and target.id in LOOP_NAMES:
+                    loops+=ast.literal_eval(node.value)
+                elif isinstance(target,ast.Name) and target.id=="SAMPLE_RATE":
+                    rate=ast.literal_eval(node.value)
+        elif isinstance(node,ast.Dict):
+            # an Engine CONFIG, other values may not be literals
+            for key,value in zip(node.keys,node.values):
+                name=key.value if isinstance(key,ast.Constant) else None
+                if name in CONFIG_HITS:
+                    hits+=ast.literal_eval(value)
+                elif name in CONFIG_LOOPS:
+                    loops+=ast.literal_eval(value)
+                elif name=="sample_rate":
+                    rate=ast.literal_eval(value)
+        elif isinstance(node,ast.Call) and getattr(node.func,"attr",None)=="Mixer":
+            for kw in node.keywords:
+                if kw.arg=="sample_rate" and isinstance(kw.value,ast.Constant):
+                    rate=kw.value.value
+    return hits,loops,rate
+
+
+def readWav(path):
+    # mono samples as floats -1..1 and the sample rate
+    with wave.open(path,"rb") as w:
+        channels=w.getnchannels()
+        width=w.getsampwidth()
+        rate=w.getframerate()
+        frames=w.readframes(w.getnframes())
+    if width==1:
+        data=[(b-128)/128 for b in frames]
+    elif width==2:
+        pcm=array.array("h",frames)
+        if sys.byteorder=="big":
+            pcm.byteswap()
+        data=[s/32768 for s in pcm]
+    else:
+        raise ValueError(f"{path}: {8*width} bit samples are not supported")
+    if channels>1:
+        data=[sum(data[i:i+channels])/channels for i in range(0,len(data),channels)]
+    return data,rate
+
+
+def resample(data,rate,target):
+    # each output is the input around it through a Hann windowed sinc,
+    # stretched when downsampling so it cuts off below the target's Nyquist
+    if rate==target or len(data)<2:
+        return data
+    step=rate/target
+    scale=min(1.0,target/rate)*CUTOFF
+    half=TAPS/scale # input samples either side
+    last=len(data)-1
+    count=int(last/step)+1
+    out=[0.0]*count
+    for i in range(count):
+        pos=i*step
+        total=weight=0.0
+        for n in range(max(0,int(pos-half)+1),min(last,int(pos+half))+1):
+            x=n-pos
+            a=math.pi*scale*x
+            h=(0.5+0.5*math.cos(math.pi*x/half))*(math.sin(a)/a if a else 1.0)
+            total+=data[n]*h
+            weight+=h
+        # normalised so a steady level comes through unchanged, at the ends too
+        out[i]=total/weight
+    return out
+
+
+def trim(data,threshold=SILENCE):
+    # start,end of the sound between the silence either side
+    start=0
+    while start<len(data) and abs(data[start])<threshold:
+        start+=1
+    end=len(data)
+    while end>start and abs(data[end-1])<threshold:
+        end-=1
+    return start,end
+
+
+def normalise(data,peak=PEAK):
+    top=max((abs(s) for s in data),default=0)
+    if top==0:
+        return data
+    scale=peak/top
+    return [s*scale for s in data]
+
+
+def snapToZero(data,start,end,rate,max_snap=MAX_SNAP):
+    # data[start:end] widened out at both ends to the nearest zero
+    # crossings within max_snap, so it starts and stops at zero
+    lowest=max(0,start-int(max_snap*rate))
+    while start>lowest and data[start-1]*data[start]>0:
+        start-=1
+    highest=min(len(data),end+int(max_snap*rate))
+    while end<highest and data[end-1]*data[end]>0:
+        end+=1
+    return data[start:end]
+
+
+def toPcm(data):
+    pcm=array.array("h",[max(-32768,min(32767,int(s*32767))) for s in data])
+    if sys.byteorder=="big":
+        pcm.byteswap()
+    return pcm
+
+
+def prepare(path,rate,hit=False):
+    data,source_rate=readWav(path)
+    data=normalise(resample(data,source_rate,rate))
+    if hit:
+        start,end=trim(data)
+        data=snapToZero(data,start,end,rate)
+    return toPcm(data)
+
+
+def writeWav(path,pcm,rate):
+    os.makedirs(os.path.dirname(path) or ".",exist_ok=True)
+    with wave.open(path,"wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(BITS//8)
+        w.setframerate(rate)
+        w.writeframes(pcm.tobytes())
+
+
+def writeBundle(path,entries):
+    # entries is a list of (name,rate,bits,pcm)
+    header=bytearray(MAGIC+struct.pack("<H",len(entries)))
+    size=len(header)+sum(1+len(n.encode())+14 for n,r,b,p in entries)
+    index=bytearray()
+    offset=size
+    for name,rate,bits,pcm in entries:
+        raw=name.encode()
+        length=len(pcm)*pcm.itemsize
+        index+=struct.pack("<B",len(raw))+raw+struct.pack("<IBBII",rate,1,bits,offset,length)
+        offset+=length
+    with open(path,"wb") as f:
+        f.write(header)
+        f.write(index)
+        for name,rate,bits,pcm in entries:
+            f.write(pcm.tobytes())
+    return offset
+
+
+def packPlayer(name,wav_dir=None):
+    hits,loops,rate=playerConfig(name)
+    if not wav_dir:
+        loops=[] # streamed from the originals
+    if not hits and not loops:
+        return None
+    if rate is None:
+        raise ValueError(f"{name}: can't find the mixer sample rate")
+    for loop in loops:
+        pcm=prepare(os.path.join(ROOT,loop),rate)
+        writeWav(os.path.join(ROOT,wav_dir,os.path.basename(loop)),pcm,rate)
+        print(f"  {loop} {len(pcm)} samples at {rate}Hz, loop")
+    entries=[]
+    for hit in hits:
+        pcm=prepare(os.path.join(ROOT,hit),rate,hit=True)
+        entries.append((hit,rate,BITS,pcm))
+        if wav_dir:
+            writeWav(os.path.join(ROOT,wav_dir,os.path.basename(hit)),pcm,rate)
+        print(f"  {hit} {len(pcm)} samples at {rate}Hz")
+    if not entries:
+        return None
+    path=os.path.join(ROOT,"Music",name+".pak")
+    size=writeBundle(path,entries)
+    print(f"{name}: {len(entries)} assets, {size} bytes -> {os.path.relpath(path,ROOT)}")
+    return path
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description="Prepare Music/ assets for the players")
+    parser.add_argument("players",nargs="*",default=PLAYERS)
+    parser.add_argument("--wav-dir",help="also write converted WAV files here")
+    args=parser.parse_args(argv)
+    for name in args.players:
+        packPlayer(name,args.wav_dir)
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,127 @@
+'''
+ReadMetrics
+
+Host side reader for the "#M" lines printed by Metrics.py. Capture the
+player's serial console to a file (or pipe it in) and this prints the loop
+time distribution and a table of the keys over the whole capture, worst
+keys marked, so the key or stage blowing the latency budget stands out.
+
+    python tools/ReadMetrics.py capture.txt
+    python tools/ReadMetrics.py capture.txt --intervals   # each dump as well
+
+Other lines in the capture are ignored.
+'''
+import sys
+import argparse
+
+PREFIX="#M "
+BUCKETS=16
+
+
+def parseLine(line):
+    # dict of a "#M" line's fields or None
+    line=line.strip()
+    if not line.startswith(PREFIX):
+        return None
+    fields={}
+    for item in line[len(PREFIX):].split():
+        name,_,value=item.partition("=")
+        fields[name]=value
+    try:
+        dump={name:int(fields[name]) for name in ("t","n","max","gc","low","mux")}
+        dump["hist"]=[int(h) for h in fields["hist"].split(",")]
+        dump["keys"]=[tuple(int(v) for v in key.split("/")) for key in fields["keys"].split(";")]
+    except (KeyError,ValueError):
+        return None
+    return dump
+
+
+def parse(lines):
+    return [dump for dump in map(parseLine,lines) if dump is not None]
+
+
+def percentile(hist,fraction):
+    # upper bound in us of the bucket holding the fraction of loops
+    total=sum(hist)
+    if total==0:
+        return 0
+    count=0
+    for i,h in enumerate(hist):
+        count+=h
+        if count>=fraction*total:
+            return 1<<i
+    return 1<<(len(hist)-1)
+
+
+def summary(dumps):
+    # combine the dumps into one
+    hist=[0]*BUCKETS
+    keys=None
+    for dump in dumps:
+        for i,h in enumerate(dump["hist"]):
+            hist[i]+=h
+        if keys is None:
+            keys=[[0,0,0,0,0] for k in dump["keys"]]
+        for k,(reads,avg,most,misses,errors) in enumerate(dump["keys"]):
+            key=keys[k]
+            key[0]+=reads
+            key[1]+=avg*reads
+            key[2]=max(key[2],most)
+            key[3]+=misses
+            key[4]+=errors
+    for key in keys or []:
+        key[1]=key[1]//key[0] if key[0] else 0
+    return {"loops":sum(d["n"] for d in dumps),
+            "max":max(d["max"] for d in dumps),
+            "hist":hist,
+            "gc":sum(d["gc"] for d in dumps),
+            "low":min(d["low"] for d in dumps),
+            "mux":sum(d["mux"] for d in dumps),
+            "seconds":(dumps[-1]["t"]-dumps[0]["t"])/1000 if len(dumps)>1 else 0,
+            "keys":keys or []}
+
+
+def report(dumps,out=sys.stdout):
+    s=summary(dumps)
+    print(f"{len(dumps)} dumps, {s['loops']} loops",file=out)
+    print(f"loop time p50 <{percentile(s['hist'],0.5)}us p99 <{percentile(s['hist'],0.99)}us"
+          f" max {s['max']}us",file=out)
+    print("histogram "+" ".join(f"<{1<<i}us:{h}" for i,h in enumerate(s["hist"]) if h),file=out)
+    print(f"gc {s['gc']} heap low {s['low']} bytes mux switches {s['mux']}",file=out)
+    keys=s["keys"]
+    if not keys:
+        return
+    missRate=[key[3]/key[0] if key[0] else 0.0 for key in keys]
+    slowest=max(range(len(keys)),key=lambda k:keys[k][2])
+    missiest=max(range(len(keys)),key=lambda k:missRate[k])
+    print(f"{'key':>4} {'reads':>8} {'avg us':>7} {'max us':>7} {'miss %':>7} {'errors':>7}",file=out)
+    for k,(reads,avg,most,misses,errors) in enumerate(keys):
+        mark=""
+        if k==slowest:
+            mark+=" slowest"
+        if k==missiest and misses:
+            mark+=" most misses"
+        if errors:
+            mark+=" errors"
+        print(f"{k:>4} {reads:>8} {avg:>7} {most:>7} {100*missRate[k]:>7.1f} {errors:>7}{mark}",file=out)
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description="Summarise Metrics dumps from a serial capture")
+    parser.add_argument("capture",nargs="?",help="captured console output, default stdin")
+    parser.add_argument("--intervals",action="store_true",help="report each dump too")
+    args=parser.parse_args(argv)
+    lines=open(args.capture) if args.capture else sys.stdin
+    dumps=parse(lines)
+    if not dumps:
+        sys.exit("No metrics found, is \"metrics\":True in the player's CONFIG?")
+    if args.intervals:
+        for dump in dumps:
+            print(f"--- t={dump['t']}ms")
+            report([dump])
+        print("--- whole capture")
+    report(dumps)
+
+
+if __name__=="__main__":
+    main()